@@ -0,0 +1,308 @@
+"""
+Sahara ASGI serving mode
+========================
+Runs the gateway (/chat, /generate, /voice) under uvicorn instead of Flask's
+blocking dev server:
+
+  cd backend
+  python asgi.py                   # 127.0.0.1:5005, drains on SIGINT/SIGTERM (see below)
+  uvicorn asgi:app --host 127.0.0.1 --port 5005 --timeout-graceful-shutdown 60
+
+The event loop itself only answers /health, /ready and /metrics. The three endpoints
+keep their Flask implementations (same JSON, same streaming), but each runs
+on its own thread pool, so a slow generation cannot hold up a transcription
+or a crisis response, and none of them can hold up /health:
+
+  /chat      CHAT_WORKERS threads      (retrieval + template)
+  /generate  GENERATE_WORKERS threads  (retrieval, then waiting on the
+                                        inference scheduler; token streams
+                                        are relayed chunk by chunk)
+  /voice     VOICE_WORKERS threads     (STT; distress has its own pool)
+
+A client that disconnects mid-stream (or whose request uvicorn cancels)
+has its response iterator closed, which cancels the generation job at the
+next token.
+
+Shutdown: `python asgi.py` drains while uvicorn is still listening. The
+first SIGINT/SIGTERM makes new requests get 503 and /ready fail (so a proxy
+stops routing here), waits up to DRAIN_TIMEOUT_S for in-flight requests,
+then lets uvicorn close its sockets; a second signal skips the wait.
+`uvicorn asgi:app` has no drain phase, since uvicorn closes its listeners
+before the app hears of the shutdown: there --timeout-graceful-shutdown is
+what gives in-flight requests time to finish. Either way the inference
+scheduler is closed last (lifespan shutdown). Use one uvicorn worker: the
+models are per process.
+"""
+import asyncio
+import io
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import chat_server
+import gateway
+import llm_server
+import telemetry
+import voice
+from models import registry
+
+CHAT_WORKERS = 4
+GENERATE_WORKERS = llm_server.MAX_QUEUE + llm_server.LLM_INSTANCES + 2   # most of these just wait
+VOICE_WORKERS = 2
+DRAIN_TIMEOUT_S = 60
+
+EXECUTORS = {
+    "/chat": ThreadPoolExecutor(CHAT_WORKERS, thread_name_prefix="asgi-chat"),
+    "/generate": ThreadPoolExecutor(GENERATE_WORKERS, thread_name_prefix="asgi-generate"),
+    "/voice": ThreadPoolExecutor(VOICE_WORKERS, thread_name_prefix="asgi-voice"),
+}
+
+
+class _State:
+    in_flight = 0
+    draining = False
+    idle = None          # asyncio.Event, set whenever in_flight drops to 0
+    loop = None          # the server's event loop, for the signal hook
+
+
+# ── Helpers ──────────────────────────────────────────────────────────────────
+async def _send_json(send, status, body, headers=()):
+    payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(payload)).encode())] + list(headers)})
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def _read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+def _environ(scope, body):
+    server = scope.get("server") or ("127.0.0.1", 5005)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif name != "content-length":
+            key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _run_wsgi(environ, loop, queue, disconnected):
+    """
+    Executor thread: runs the Flask view, iterates and closes its body, all
+    on this one thread (stream_with_context generators must not hop threads),
+    handing ("start" | "body" | "error" | "end", ...) items to the event loop.
+    Closing a streamed /generate response cancels its generation job.
+    """
+    def put(*item):
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"], started["headers"] = status, headers
+
+    chunks = None
+    try:
+        chunks = gateway.app(environ, start_response)
+        put("start", int(started["status"].split()[0]), started["headers"])
+        for chunk in chunks:
+            if disconnected.is_set():
+                break
+            if chunk:
+                put("body", chunk)
+    except Exception as e:
+        put("error", e)
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+        put("end")
+
+
+async def _wait_disconnect(receive):
+    # After the request body, the only message left to receive is the disconnect
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+# ── Endpoints ────────────────────────────────────────────────────────────────
+async def _health(send):
+    await _send_json(send, 200, {"status": "draining" if _State.draining else "ok",
+                                 "in_flight": _State.in_flight,
+                                 "chat": chat_server.health_body(),
+                                 "llm": llm_server.health_body(), "voice": voice.health_body()})
+
+
+async def _ready(send):
+    body, status = registry.readiness(gateway.REQUIRED_MODELS)
+    if _State.draining:
+        body, status = dict(body, draining=True), 503
+    await _send_json(send, status, body)
+
+
+async def _metrics(send):
+    payload = telemetry.render().encode("utf-8")
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", telemetry.CONTENT_TYPE.encode()),
+                            (b"content-length", str(len(payload)).encode())]})
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def _offloaded(scope, receive, send, executor):
+    """One blocking endpoint on its executor, response streamed back chunk by chunk."""
+    loop = asyncio.get_running_loop()
+    body = await _read_body(receive)
+    if body is None:
+        return
+    queue = asyncio.Queue()
+    disconnected = threading.Event()
+    worker = loop.run_in_executor(executor, _run_wsgi, _environ(scope, body), loop, queue, disconnected)
+    watcher = asyncio.ensure_future(_wait_disconnect(receive))
+    watcher.add_done_callback(lambda task: disconnected.set())
+
+    started = False
+    try:
+        while True:
+            kind, *item = await queue.get()
+            if kind == "start":
+                status, headers = item
+                await send({"type": "http.response.start", "status": status,
+                            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+                started = True
+            elif kind == "body" and not disconnected.is_set():
+                await send({"type": "http.response.body", "body": item[0], "more_body": True})
+            elif kind == "error" and not started:
+                await _send_json(send, 500, {"error": str(item[0])})
+                return
+            elif kind == "end":
+                break
+        if started:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+    finally:
+        # Done, or cancelled by uvicorn: either way the worker stops at its next
+        # chunk and closes the response (and its generation job)
+        disconnected.set()
+        watcher.cancel()
+    await worker
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            _State.loop = asyncio.get_running_loop()
+            _State.idle = asyncio.Event()
+            _State.idle.set()
+            registry.warmup(gateway.REQUIRED_MODELS)
+            llm_server.scheduler.start()
+            voice.start_stt_server()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # uvicorn has stopped listening and finished (or cancelled) its requests
+            _State.draining = True
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, llm_server.scheduler.close, 5)
+            for executor in EXECUTORS.values():
+                executor.shutdown(wait=False, cancel_futures=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    path = scope["path"]
+    if path == "/health":
+        await _health(send)
+    elif path == "/ready":
+        await _ready(send)
+    elif path == "/metrics":
+        await _metrics(send)
+    elif path in EXECUTORS:
+        if _State.draining:
+            await _send_json(send, 503, {"error": "server is shutting down"}, [(b"retry-after", b"5")])
+            return
+        _State.in_flight += 1
+        if _State.idle is not None:
+            _State.idle.clear()
+        try:
+            await _offloaded(scope, receive, send, EXECUTORS[path])
+        finally:
+            _State.in_flight -= 1
+            if _State.in_flight == 0 and _State.idle is not None:
+                _State.idle.set()
+    else:
+        await _send_json(send, 404, {"error": "not found"})
+
+
+# ── Draining server ──────────────────────────────────────────────────────────
+async def _drain():
+    print(f"Draining {_State.in_flight} in-flight requests (up to {DRAIN_TIMEOUT_S}s)")
+    try:
+        await asyncio.wait_for(_State.idle.wait(), DRAIN_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        print(f"Shutdown: {_State.in_flight} requests still running after {DRAIN_TIMEOUT_S}s")
+
+
+def draining_server(config):
+    """A uvicorn.Server whose first exit signal drains the app before uvicorn stops listening."""
+    import uvicorn
+
+    class DrainingServer(uvicorn.Server):
+        def handle_exit(self, sig, frame):
+            if _State.draining or _State.loop is None:
+                super().handle_exit(sig, frame)
+                return
+            _State.draining = True
+
+            def drained(task):
+                super(DrainingServer, self).handle_exit(sig, frame)
+
+            _State.loop.call_soon_threadsafe(
+                lambda: asyncio.ensure_future(_drain()).add_done_callback(drained))
+
+    return DrainingServer(config)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    print(f"🌿 Sahara gateway (ASGI) → http://127.0.0.1:{gateway.GATEWAY_PORT}  (/chat, /generate, /voice)")
+    print(f"   Streaming STT → ws://127.0.0.1:{voice.STT_WS_PORT}/stt")
+    # In-flight requests are drained before uvicorn's own graceful shutdown starts
+    draining_server(uvicorn.Config(app, host="127.0.0.1", port=gateway.GATEWAY_PORT,
+                                   timeout_graceful_shutdown=5)).run()
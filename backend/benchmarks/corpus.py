@@ -0,0 +1,178 @@
+"""
+Synthetic WhatsApp corpus and voice clips for benchmarks
+========================================================
+Generates family-chat exports of any size (1k to 1M+ messages) in the four
+layouts rag.iter_whatsapp_messages has to handle, plus 16 kHz WAV clips for
+the voice path. Everything is seeded, so the same arguments always produce
+the same bytes.
+
+  ios        [15/08/2023, 9:05:12 PM] Aai: message
+  android    15/08/23, 21:05 - Aai: message
+  android12  15/08/23, 9:05 pm - Aai: message
+  us         8/15/23, 9:05 PM - Aai: message          (month first)
+
+The message stream depends only on the seed, not the layout, so every
+format of one size parses to the same messages. Exports include what real
+ones do: Hinglish/Marathi text, emoji, multi-line messages, media
+placeholders, deleted messages and sender-less system notices.
+
+  cd backend
+  python benchmarks/corpus.py --messages 100000 --format android --out chat.txt
+  python benchmarks/corpus.py --wav 5 --out clip.wav
+"""
+import argparse
+import io
+import random
+import wave
+from datetime import datetime, timedelta
+
+import numpy as np
+
+FORMATS = ("ios", "android", "android12", "us")
+SENDERS = ("Aai", "Baba", "Arya", "Tai", "Aaji")
+SAMPLE_RATE = 16000
+
+# Day > 12 on the first line, so the day/month order is sniffed unambiguously
+START = datetime(2021, 3, 14, 8, 30)
+
+SYSTEM_NOTICES = (
+    "Messages and calls are end-to-end encrypted. No one outside of this chat, "
+    "not even WhatsApp, can read or listen to them.",
+    "Aai changed this group's icon",
+    "Baba added Aaji",
+)
+PLACEHOLDERS = ("<Media omitted>", "image omitted", "sticker omitted", "This message was deleted")
+
+OPENERS = ("Arya beta", "Aai", "Baba", "Tai", "Aaji", "Beta", "Arre", "Suno", "Aga", "Ho")
+PHRASES = (
+    "jevan kela ka", "lavkar ghari ye", "modak tayar ahet", "khup aathvan yet aahe",
+    "Diwali la ghari yenar ka", "office madhe sagla theek aahe na", "thand ahe, swetter ghal",
+    "aaj mandirat gelo hoto", "doctor kade jaun aalis ka", "tujhi khup kaalji vatte",
+    "kal raatri zop lagli nahi", "gaadi shant chalav", "pausaat bhijla nahis na",
+    "Ganpati chi tayari suru zhali", "aamhi tujhi vaat baghtoy", "phone kar jara",
+    "miss you so much", "take care of yourself", "call me when you reach",
+    "exam kasa gela", "tujhya aavdicha shira kela", "aaj baag madhe firayla gelo",
+    "bahut yaad aa rahi hai", "kal baat karte hain", "dawai time pe lena",
+)
+CLOSERS = ("", "", "", " 🙏", " 💙", " ❤️", " 😊", " 😂", "!", "...", " na?", " beta")
+
+
+def _message(rng):
+    text = f"{rng.choice(OPENERS)}, {rng.choice(PHRASES)}{rng.choice(CLOSERS)}"
+    if rng.random() < 0.3:
+        text += f". {rng.choice(PHRASES).capitalize()}{rng.choice(CLOSERS)}"
+    if rng.random() < 0.03:
+        text += "\n" + rng.choice(PHRASES).capitalize()   # multi-line message
+    return text
+
+
+def iter_messages(n, seed=0):
+    """Yields (date, sender or None, text) for n sender messages, system notices interleaved."""
+    rng = random.Random(seed)
+    date = START
+    sender = rng.choice(SENDERS)
+    yield date, None, SYSTEM_NOTICES[0]
+    for _ in range(n):
+        # Bursts within minutes, quiet hours, occasionally days of silence
+        roll = rng.random()
+        if roll < 0.7:
+            date += timedelta(seconds=rng.randint(5, 300))
+        elif roll < 0.97:
+            date += timedelta(minutes=rng.randint(30, 600))
+        else:
+            date += timedelta(days=rng.randint(1, 5), minutes=rng.randint(0, 600))
+        if rng.random() < 0.4:
+            sender = rng.choice(SENDERS)
+        if rng.random() < 0.001:
+            yield date, None, rng.choice(SYSTEM_NOTICES[1:])
+        text = rng.choice(PLACEHOLDERS) if rng.random() < 0.04 else _message(rng)
+        yield date, sender, text
+
+
+def _hour12(date):
+    return date.hour % 12 or 12, "AM" if date.hour < 12 else "PM"
+
+
+def format_line(fmt, date, sender, text):
+    """One export line (continuation lines of a multi-line text follow after newlines)."""
+    head = f"{sender}: " if sender else ""
+    if fmt == "ios":
+        hour, meridiem = _hour12(date)
+        mark = "\u200e" if text in PLACEHOLDERS[1:3] else ""
+        return f"{mark}[{date:%d/%m/%Y}, {hour}:{date:%M:%S} {meridiem}] {head}{text}"
+    if fmt == "android":
+        return f"{date:%d/%m/%y, %H:%M} - {head}{text}"
+    if fmt == "android12":
+        hour, meridiem = _hour12(date)
+        return f"{date:%d/%m/%y}, {hour}:{date:%M} {meridiem.lower()} - {head}{text}"
+    if fmt == "us":
+        hour, meridiem = _hour12(date)
+        return f"{date.month}/{date.day}/{date:%y}, {hour}:{date:%M} {meridiem} - {head}{text}"
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def write_export(path, n, fmt="android", seed=0):
+    """Writes an n-message export to path, streaming. Returns the bytes written."""
+    with open(path, "w", encoding="utf-8") as f:
+        for date, sender, text in iter_messages(n, seed):
+            f.write(format_line(fmt, date, sender, text) + "\n")
+        return f.tell()
+
+
+def queries(n, seed=1):
+    """n distinct user messages in the corpus's vocabulary (a fresh seed avoids cache hits)."""
+    rng = random.Random(seed)
+    out = ["Missing Aai today", "Aai chi khup aathvan yet aahe", "Diwali without Baba feels empty"]
+    seen = set(out)
+    while len(out) < n:
+        query = f"{rng.choice(PHRASES)} {rng.choice(PHRASES)}"
+        if query not in seen:
+            seen.add(query)
+            out.append(query)
+    return out[:n]
+
+
+def speech_like(seconds, seed=0, sr=SAMPLE_RATE):
+    """Float audio resembling speech: harmonic voice with a wandering pitch, syllable envelope, room noise."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    t = np.arange(n) / sr
+    f0 = 180 + 40 * np.sin(2 * np.pi * 0.7 * t) + 15 * np.cumsum(rng.standard_normal(n)) / np.sqrt(sr * 50)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t + rng.uniform(0, np.pi)), 0, None) ** 0.5
+    pauses = np.repeat(rng.random(int(np.ceil(seconds * 2))) > 0.15, sr // 2)[:n]
+    audio = 0.15 * voice / np.max(np.abs(voice)) * syllables * pauses + 0.005 * rng.standard_normal(n)
+    return audio.astype(np.float32)
+
+
+def wav_bytes(audio, sr=SAMPLE_RATE):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+    return buf.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--format", choices=FORMATS, default="android")
+    parser.add_argument("--wav", type=float, metavar="SECONDS", help="write a speech-like WAV clip instead")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.wav:
+        with open(args.out, "wb") as f:
+            f.write(wav_bytes(speech_like(args.wav, args.seed)))
+        print(f"Wrote {args.wav}s clip to {args.out}")
+    else:
+        size = write_export(args.out, args.messages, args.format, args.seed)
+        print(f"Wrote {args.messages} messages ({size / 1e6:.1f} MB, {args.format}) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Distress feature benchmark: librosa (pyin) vs distress.py (vectorized YIN)
+==========================================================================
+Runs the previous analyze_distress pipeline (librosa.load + pyin + rms + zcr)
+and the current one (voice.analyze_distress → distress.py) on synthetic
+16 kHz signals with known pitch, and reports per signal:
+
+  - whether score / level / flags agree
+  - median absolute F0 error against the true pitch (voiced frames) and the
+    share of truly voiced frames each tracker marks voiced
+  - wall time and speed as a multiple of real time (decode included)
+
+  cd backend
+  python benchmarks/distress_features.py
+  python benchmarks/distress_features.py --seconds 10 --json distress.json
+
+librosa is only needed for the reference column; without it just the new
+implementation is measured.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import distress  # noqa: E402
+from voice import analyze_distress, read_pcm, SAMPLE_RATE  # noqa: E402
+
+SR = SAMPLE_RATE
+
+
+def voiced_tone(f0, amplitude=0.1):
+    """Harmonic tone (roughly voice-like spectrum) following the per-sample pitch track f0."""
+    phase = 2 * np.pi * np.cumsum(f0) / SR
+    wave_ = sum(np.sin(k * phase) / k for k in range(1, 6))
+    return amplitude * wave_ / np.max(np.abs(wave_))
+
+
+def synthetic_signals(seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SR)) / SR
+    steady = np.full_like(t, 200.0)
+    glide = 120 + 230 * t / seconds
+    vibrato = 220 + 80 * np.sin(2 * np.pi * 3 * t)
+    bursts = (np.sin(2 * np.pi * 1.5 * t) > 0).astype(float)
+    return {
+        "steady_200hz": (voiced_tone(steady), steady),
+        "glide_120_350hz": (voiced_tone(glide), glide),
+        "vibrato_220hz": (voiced_tone(vibrato), vibrato),
+        "loud_bursts_180hz": (voiced_tone(np.full_like(t, 180.0), 0.4) * bursts, np.where(bursts > 0, 180.0, np.nan)),
+        "white_noise": (0.05 * rng.standard_normal(len(t)), np.full_like(t, np.nan)),
+        "silence": (np.zeros_like(t), np.full_like(t, np.nan)),
+    }
+
+
+def to_wav(audio):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SR)
+        w.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+    return buf.getvalue()
+
+
+def librosa_reference(audio_bytes):
+    """The analyze_distress implementation distress.py replaced (verbatim thresholds)."""
+    import librosa
+    audio, sr = librosa.load(io.BytesIO(audio_bytes), sr=SR, mono=True)
+    f0, _, _ = librosa.pyin(audio, fmin=80, fmax=400, sr=sr)
+    rms = librosa.feature.rms(y=audio)[0]
+    zcr = librosa.feature.zero_crossing_rate(audio)[0]
+    return distress.score_features({"f0": f0, "rms": rms, "zcr": zcr}), f0
+
+
+def pitch_accuracy(f0, truth_per_sample):
+    centres = np.minimum(np.arange(len(f0)) * distress.HOP_LENGTH, len(truth_per_sample) - 1)
+    truth = truth_per_sample[centres]
+    voiced = ~np.isnan(truth)
+    if not voiced.any():
+        return {"false_voiced": round(float(np.mean(~np.isnan(f0))), 3)}
+    both = voiced & ~np.isnan(f0)
+    return {
+        "f0_median_abs_err_hz": round(float(np.median(np.abs(f0[both] - truth[both]))), 2) if both.any() else None,
+        "voiced_recall": round(float(both.sum() / voiced.sum()), 3),
+    }
+
+
+def timed(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    try:
+        import librosa  # noqa: F401
+        have_librosa = True
+    except ImportError:
+        print("librosa not installed: measuring distress.py only")
+        have_librosa = False
+
+    results = []
+    for name, (audio, truth) in synthetic_signals(args.seconds).items():
+        wav = to_wav(audio)
+        new, new_s = timed(lambda: analyze_distress(wav), args.repeats)
+        new_f0 = distress.extract_features(distress.pcm_to_float(read_pcm(wav)[0], SR, SR), SR)["f0"]
+        row = {
+            "signal": name,
+            "new": new,
+            "new_ms": round(new_s * 1000, 1),
+            "new_x_realtime": round(args.seconds / new_s, 1),
+            "new_pitch": pitch_accuracy(new_f0, truth),
+        }
+        if have_librosa:
+            (old, old_f0), old_s = timed(lambda: librosa_reference(wav), args.repeats)
+            row.update({
+                "old": old,
+                "old_ms": round(old_s * 1000, 1),
+                "old_x_realtime": round(args.seconds / old_s, 1),
+                "old_pitch": pitch_accuracy(old_f0, truth),
+                "same_flags": old["flags"] == new["flags"],
+                "speedup": round(old_s / new_s, 1),
+            })
+        results.append(row)
+        print(json.dumps(row))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+End-to-end pipeline benchmark
+=============================
+Times every stage of Sahara on synthetic data (benchmarks/corpus.py), in a
+throwaway store so ./chroma_db is never touched:
+
+  parse     rag.parse_whatsapp_chat, every export format and size
+  ingest    rag.create_vector_store, first import and an unchanged re-import
+  retrieve  rag.retrieve_memories, distinct queries (p50 / p95, stage split)
+  generate  llm_server.generate_response through the scheduler
+            (TTFT, tokens/s, prompt tokens, prefix cache reuse)
+  distress  voice.analyze_distress on speech-like WAV clips (x real time)
+
+By default the embedder and the LLM are deterministic stubs, so the suite
+runs offline in seconds and its numbers measure Sahara's own code. Use
+--embedder real / --llm real to load all-MiniLM-L6-v2 and the GGUF model.
+
+  cd backend
+  python benchmarks/pipeline.py                                   # 1k / 10k, stubs
+  python benchmarks/pipeline.py --sizes 1000 100000 1000000 --ingest-max 100000
+  python benchmarks/pipeline.py --json after.json --compare before.json
+  SAHARA_VECTOR_BACKEND=numpy python benchmarks/pipeline.py --stages ingest retrieve
+
+Every result row has a key (e.g. "retrieve/10000") and an "ms" headline
+figure; --compare prints the change against an earlier --json run.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+import corpus  # noqa: E402  (benchmarks/ is on sys.path when run as a script)
+
+STAGES = ("parse", "ingest", "retrieve", "generate", "distress")
+
+
+# ── Stub models ──────────────────────────────────────────────────────────────
+class StubEmbedder:
+    """SentenceTransformer stand-in: signed feature hashing of words and character trigrams, 384-d."""
+    dim = 384
+
+    def _vector(self, text):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        text = text.lower()
+        words = text.split()
+        features = words + [text[i:i + 3] for i in range(len(text) - 2)]
+        for feature in features:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=4).digest(), "little")
+            vec[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return vec / (np.linalg.norm(vec) or 1.0)
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        return np.stack([self._vector(t) for t in texts]) if texts else np.zeros((0, self.dim), np.float32)
+
+
+class StubLlama:
+    """
+    llama_cpp.Llama stand-in with the surface llm_server and PrefixCache use.
+    Tokens are hashed 4-character pieces; the reply is a fixed sentence picked
+    by the prompt. prefill_ms / decode_ms per token simulate model cost, and
+    prefill is only charged for tokens past the prefix already evaluated, like
+    llama.cpp's prefix reuse.
+    """
+    REPLIES = (
+        "Sahara: Mujhe yaad hai, Aai ne modak banaye the. Tum thoda rest karo, main yahin hoon.",
+        "Sahara: Aathvan yena sahaj aahe. Ek deep breath ghe, aur mala sang kasa vatatay.",
+        "Sahara: I hear you. Those Diwali memories are precious; would you like to share one?",
+    )
+
+    def __init__(self, n_ctx=2048, prefill_ms=0.0, decode_ms=0.0):
+        self._n_ctx = n_ctx
+        self.prefill_ms = prefill_ms
+        self.decode_ms = decode_ms
+        self.input_ids = []
+
+    @property
+    def n_tokens(self):
+        return len(self.input_ids)
+
+    def n_ctx(self):
+        return self._n_ctx
+
+    def tokenize(self, text, add_bos=True, special=False):
+        tokens = [1] if add_bos else []
+        for i in range(0, len(text), 4):
+            tokens.append(int.from_bytes(hashlib.blake2b(text[i:i + 4], digest_size=2).digest(), "little") + 3)
+        return tokens
+
+    def reset(self):
+        self.input_ids = []
+
+    def eval(self, tokens):
+        self._prefill(len(tokens))
+        self.input_ids = self.input_ids + list(tokens)
+
+    def save_state(self):
+        return list(self.input_ids)
+
+    def load_state(self, state):
+        self.input_ids = list(state)
+
+    def _prefill(self, n):
+        if self.prefill_ms:
+            time.sleep(n * self.prefill_ms / 1000)
+
+    def __call__(self, prompt, stream=False, max_tokens=200, **kwargs):
+        common = 0
+        for a, b in zip(self.input_ids, prompt):
+            if a != b:
+                break
+            common += 1
+        self._prefill(len(prompt) - common)
+        self.input_ids = list(prompt)
+        words = self.REPLIES[sum(prompt) % len(self.REPLIES)].split(" ")
+
+        def chunks():
+            for i, word in enumerate(words[:max_tokens]):
+                if self.decode_ms:
+                    time.sleep(self.decode_ms / 1000)
+                yield {"choices": [{"text": word if i == 0 else " " + word}]}
+        return chunks()
+
+
+# ── Helpers ──────────────────────────────────────────────────────────────────
+def _percentile(values, q):
+    return round(float(np.percentile(values, q)), 3) if values else None
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _row(key, ms, **fields):
+    row = {"key": key, "ms": round(ms, 3), **fields}
+    print(json.dumps(row, ensure_ascii=False))
+    return row
+
+
+# ── Stages ───────────────────────────────────────────────────────────────────
+def bench_parse(rag, workdir, sizes, formats):
+    rows, exports = [], {}
+    for n in sizes:
+        for fmt in formats:
+            path = os.path.join(workdir, f"chat_{n}_{fmt}.txt")
+            size = corpus.write_export(path, n, fmt)
+            exports.setdefault(n, path)
+            start = time.perf_counter()
+            messages = rag.parse_whatsapp_chat(path)
+            ms = (time.perf_counter() - start) * 1000
+            rows.append(_row(f"parse/{n}/{fmt}", ms, messages=len(messages), expected=n,
+                             mb=round(size / 1e6, 2), messages_per_s=round(len(messages) / (ms / 1000))))
+            del messages
+    return rows, exports
+
+
+def bench_ingest(rag, exports, sizes):
+    rows = []
+    for n in sizes:
+        messages = rag.parse_whatsapp_chat(exports[n])
+        collection = f"bench_{n}"
+        start = time.perf_counter()
+        rag.create_vector_store(messages, collection_name=collection)
+        first_ms = (time.perf_counter() - start) * 1000
+        chunks = rag.get_store().get_index(collection).count()
+
+        start = time.perf_counter()
+        rag.create_vector_store(messages, collection_name=collection)
+        again_ms = (time.perf_counter() - start) * 1000
+        rows.append(_row(f"ingest/{n}", first_ms, chunks=chunks, chunks_per_s=round(chunks / (first_ms / 1000)),
+                         reimport_ms=round(again_ms, 3), store_mb=round(_dir_size(rag.CHROMA_PATH) / 1e6, 2)))
+    return rows
+
+
+def bench_retrieve(rag, sizes, queries):
+    rows = []
+    for n in sizes:
+        collection = f"bench_{n}"
+        latencies, stages, found = [], [], 0
+        for query in queries:
+            timings = {}
+            start = time.perf_counter()
+            found += len(rag.retrieve_memories(query, collection_name=collection, top_k=5, timings=timings))
+            latencies.append((time.perf_counter() - start) * 1000)
+            stages.append(timings)
+        # The first query opens the collection; report it separately
+        rows.append(_row(f"retrieve/{n}", _percentile(latencies[1:] or latencies, 50),
+                         first_ms=round(latencies[0], 3),
+                         p95_ms=_percentile(latencies[1:] or latencies, 95),
+                         lexical_ms=_percentile([t["lexical_ms"] for t in stages], 50),
+                         embed_ms=_percentile([t["embed_ms"] for t in stages], 50),
+                         dense_ms=_percentile([t["dense_ms"] for t in stages], 50),
+                         dense_skipped=round(sum(t["dense_skipped"] for t in stages) / len(stages), 3),
+                         mean_results=round(found / len(queries), 2)))
+    return rows
+
+
+def bench_generate(rag, llm_server, collection, queries):
+    llm_server.scheduler.start()
+    latencies, ttft, rates, prompt_tokens, waits = [], [], [], [], []
+    try:
+        for query in queries:
+            memories = rag.retrieve_memories(query, collection_name=collection, top_k=llm_server.RETRIEVE_K) \
+                if collection else []
+            timings = {}
+            start = time.perf_counter()
+            llm_server.generate_response(query, memories, timings)
+            latencies.append((time.perf_counter() - start) * 1000)
+            ttft.append(timings.get("ttft_ms", timings["total_ms"]))
+            rates.append(timings["tokens"] / (timings["total_ms"] / 1000) if timings["total_ms"] else 0.0)
+            prompt_tokens.append(timings["prompt_tokens"])
+            waits.append(timings["queue_wait_ms"])
+    finally:
+        llm_server.scheduler.close(5)
+    prefix = llm_server.prefix_caches[0].stats()
+    return [_row("generate", _percentile(latencies, 50), p95_ms=_percentile(latencies, 95),
+                 ttft_ms=_percentile(ttft, 50), tokens_per_s=_percentile(rates, 50),
+                 prompt_tokens=_percentile(prompt_tokens, 50), queue_wait_ms=_percentile(waits, 50),
+                 prefix_cache=prefix, queries=len(queries))]
+
+
+def bench_distress(voice, clip_seconds, repeats):
+    rows = []
+    for seconds in clip_seconds:
+        wav = corpus.wav_bytes(corpus.speech_like(seconds))
+        best, result = float("inf"), None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = voice.analyze_distress(wav)
+            best = min(best, time.perf_counter() - start)
+        rows.append(_row(f"distress/{seconds:g}s", best * 1000, x_realtime=round(seconds / best, 1),
+                         level=result["level"], flags=result["flags"]))
+    return rows
+
+
+# ── Comparison ───────────────────────────────────────────────────────────────
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {row["key"]: row for row in json.load(f)["results"]}
+    print(f"\nvs {baseline_path} (ms, lower is better):")
+    for row in results:
+        old = baseline.get(row["key"])
+        if old is None or not old.get("ms") or row.get("ms") is None:
+            continue
+        ratio = row["ms"] / old["ms"]
+        mark = "  REGRESSION" if ratio > 1.2 else ""
+        print(f"  {row['key']:<28} {old['ms']:>11.2f} → {row['ms']:>11.2f}  x{ratio:.2f}{mark}")
+
+
+# ── Main ─────────────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="messages per export")
+    parser.add_argument("--ingest-max", type=int, default=100000,
+                        help="largest size to ingest and query (parse runs for all sizes)")
+    parser.add_argument("--formats", nargs="+", choices=corpus.FORMATS, default=list(corpus.FORMATS))
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--clips", type=float, nargs="+", default=[2, 5, 10], help="WAV clip lengths (s)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--embedder", choices=("stub", "real"), default="stub")
+    parser.add_argument("--llm", choices=("stub", "real"), default="stub")
+    parser.add_argument("--stub-prefill-ms", type=float, default=0.0, help="stub LLM cost per prefilled token")
+    parser.add_argument("--stub-decode-ms", type=float, default=0.0, help="stub LLM cost per generated token")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="earlier --json file to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary store and exports")
+    args = parser.parse_args()
+
+    started = time.strftime("%Y-%m-%dT%H:%M:%S")
+    output = os.path.abspath(args.json) if args.json else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    workdir = tempfile.mkdtemp(prefix="sahara-bench-")
+    import rag
+    rag.CHROMA_PATH = os.path.join(workdir, "chroma_db")   # before anything opens a store
+    import llm_server
+    import voice
+    from models import registry
+
+    if args.embedder == "stub":
+        registry.register("embedder", StubEmbedder)
+    if args.llm == "stub":
+        registry.register("llm", lambda: StubLlama(llm_server.N_CTX, args.stub_prefill_ms, args.stub_decode_ms))
+    else:
+        llm_server.MODEL_PATH = os.path.join(BACKEND_DIR, llm_server.MODEL_PATH)
+
+    ingest_sizes = [n for n in args.sizes if n <= args.ingest_max]
+    queries = corpus.queries(args.queries)
+    results = []
+    try:
+        exports = {}
+        if "parse" in args.stages or ingest_sizes:
+            rows, exports = bench_parse(rag, workdir, args.sizes,
+                                        args.formats if "parse" in args.stages else args.formats[:1])
+            if "parse" in args.stages:
+                results += rows
+        if ingest_sizes and {"ingest", "retrieve", "generate"} & set(args.stages):
+            rows = bench_ingest(rag, exports, ingest_sizes)
+            if "ingest" in args.stages:
+                results += rows
+        if "retrieve" in args.stages:
+            results += bench_retrieve(rag, ingest_sizes, queries)
+        if "generate" in args.stages:
+            collection = f"bench_{ingest_sizes[-1]}" if ingest_sizes else None
+            results += bench_generate(rag, llm_server, collection, queries[:max(args.queries // 5, 1)])
+        if "distress" in args.stages:
+            results += bench_distress(voice, args.clips, args.repeats)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"Kept {workdir}")
+
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "started": started,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "vector_backend": rag.VECTOR_BACKEND,
+            "models": {"embedder": args.embedder, "llm": args.llm,
+                       "load_seconds": registry.status()},
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Vector backend benchmark: Chroma vs in-process NumPy index (int8 / float16)
+===========================================================================
+Measures recall@k against exact float32 search, query latency, cold open
+time and on-disk size on synthetic clustered 384-d unit vectors (real MiniLM
+embeddings of one chat cluster tightly, so uniform random vectors would be
+unrealistically easy for HNSW).
+
+  cd backend
+  python benchmarks/vector_backends.py                  # 1k / 10k / 100k
+  python benchmarks/vector_backends.py --sizes 1000 5000 --queries 100
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vector_index import NumpyStore  # noqa: E402
+
+DIM = 384
+
+
+def synthetic_corpus(n, n_queries, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(n // 50, 8), DIM)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=n)] + 0.6 * rng.standard_normal((n, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.integers(n, size=n_queries)] + 0.3 * rng.standard_normal((n_queries, DIM)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries
+
+
+def exact_top_k(vectors, queries, k):
+    return np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def open_backend(kind, path):
+    if kind == "chroma":
+        from store import StoreManager
+        return StoreManager(path)
+    return NumpyStore(path, dtype='float16' if kind == "numpy-f16" else 'int8')
+
+
+def run_backend(kind, vectors, queries, truth, k):
+    path = tempfile.mkdtemp(prefix=f"sahara-bench-{kind}-")
+    try:
+        ids = [f"{i:032x}" for i in range(len(vectors))]
+        store = open_backend(kind, path)
+        index = store.get_index("bench", create=True)
+
+        start = time.perf_counter()
+        for lo in range(0, len(ids), index.max_batch_size):
+            hi = lo + index.max_batch_size
+            index.upsert(ids[lo:hi], vectors[lo:hi].tolist(),
+                         [f"message {i}" for i in range(lo, min(hi, len(ids)))],
+                         [{"date": "2024-01-01T00:00:00", "sender": "Aai"}] * (min(hi, len(ids)) - lo))
+        index.commit()
+        build_s = time.perf_counter() - start
+        del index, store
+
+        # Cold open in a fresh store object, then first query
+        start = time.perf_counter()
+        index = open_backend(kind, path).get_index("bench")
+        index.query(queries[0].tolist(), k)
+        open_s = time.perf_counter() - start
+
+        latencies, hits = [], 0
+        for q, expected in zip(queries, truth):
+            start = time.perf_counter()
+            results = index.query(q.tolist(), k)
+            latencies.append(time.perf_counter() - start)
+            hits += len({int(r['id'], 16) for r in results} & set(expected.tolist()))
+
+        return {
+            "backend": kind,
+            "vectors": len(vectors),
+            f"recall@{k}": round(hits / (len(queries) * k), 4),
+            "query_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+            "query_p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+            "build_s": round(build_s, 2),
+            "cold_open_first_query_s": round(open_s, 3),
+            "disk_mb": round(dir_size(path) / 1e6, 1),
+        }
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--backends", nargs="+", default=["chroma", "numpy", "numpy-f16"])
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for n in args.sizes:
+        vectors, queries = synthetic_corpus(n, args.queries)
+        truth = exact_top_k(vectors, queries, args.k)
+        for kind in args.backends:
+            try:
+                row = run_backend(kind, vectors, queries, truth, args.k)
+            except ImportError as e:
+                print(f"skipping {kind}: {e}")
+                continue
+            results.append(row)
+            print(json.dumps(row))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,16 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify
+from models import registry
 from rag import generate_response
+import telemetry
 
-app = Flask(__name__)
+# /chat lives on a blueprint so gateway.py can mount it next to /generate and /voice
+bp = Blueprint("chat", __name__)
+
+# Models /chat needs before it can answer quickly
+REQUIRED_MODELS = ["embedder"]
 
-@app.route("/chat", methods=["POST"])
+@bp.route("/chat", methods=["POST"])
+@telemetry.traced("chat.request", headers=lambda: request.headers)
 def chat():
     data = request.json
     message = data.get("message", "")
@@ -16,6 +23,36 @@ def chat():
     return jsonify({"response": response})
 
 
+def chat_reply(message):
+    """In-process /chat: what gateway.py hands to voice instead of an HTTP call."""
+    return generate_response(message)
+
+
+def health_body():
+    return {"status": "ok"}
+
+
+# Standalone server (gateway.py serves the same routes in one process)
+app = Flask(__name__)
+app.register_blueprint(bp)
+
+@app.route("/health", methods=["GET"])
+def health():
+    return jsonify(health_body())
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    body, status = registry.readiness(REQUIRED_MODELS)
+    return jsonify(body), status
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(telemetry.render(), content_type=telemetry.CONTENT_TYPE)
+
+
 if __name__ == "__main__":
     print("🌿 Sahara Phase 2 Chat API → http://127.0.0.1:5006")
-    app.run(port=5006)
\ No newline at end of file
+    registry.warmup(REQUIRED_MODELS)
+    app.run(port=5006)
@@ -0,0 +1,139 @@
+"""
+Sahara conversation-window chunking
+===================================
+Embedding every WhatsApp message separately inflates the index with tiny
+fragments, and the old > 10 character filter dropped short but meaningful
+lines ("Ho Aai"). Instead, consecutive messages are grouped into windows:
+
+  - a new window starts after a silence longer than max_gap_minutes
+  - a window holds at most max_messages lines / max_chars characters
+    (MiniLM truncates at ~256 word pieces, so 600 chars stays inside it)
+  - when a window is full it is cut at the last change of sender, so one
+    person's burst of messages is not split across two windows
+
+Each window is embedded once. Its document is the "Sender: message" lines
+joined by newlines; metadata keeps the character offset of every line so
+callers can show the exact line that matched (memory_lines / best_line).
+"""
+import hashlib
+import re
+
+MAX_GAP_MINUTES = 30
+MAX_MESSAGES = 8
+MAX_CHARS = 600
+
+# Export placeholders that carry no words worth embedding
+_PLACEHOLDERS = {
+    "<media omitted>", "image omitted", "video omitted", "audio omitted",
+    "sticker omitted", "gif omitted", "document omitted", "this message was deleted",
+    "you deleted this message", "null",
+}
+
+_WORD = re.compile(r"\w+")
+
+
+def _is_placeholder(text):
+    return text.strip().lstrip('\u200e').lower() in _PLACEHOLDERS
+
+
+def _window_record(msgs):
+    lines = [f"{m['sender']}: {m['message']}" for m in msgs]
+    offsets, pos = [], 0
+    for line in lines:
+        offsets.append(pos)
+        pos += len(line) + 1
+    document = "\n".join(lines)
+
+    digest = hashlib.blake2b(digest_size=16)
+    for m in msgs:
+        digest.update(f"{m['date'].isoformat()}\x1f{m['sender']}\x1f{m['message']}\x1e".encode('utf-8'))
+
+    senders = list(dict.fromkeys(m['sender'] for m in msgs))
+    metadata = {
+        'date': msgs[0]['date'].isoformat(),
+        'end_date': msgs[-1]['date'].isoformat(),
+        'sender': msgs[0]['sender'],
+        'senders': ", ".join(senders),
+        'count': len(msgs),
+        'offsets': ",".join(map(str, offsets)),   # Chroma metadata must be scalar
+    }
+    return digest.hexdigest(), document, metadata
+
+
+def conversation_windows(messages, max_gap_minutes=MAX_GAP_MINUTES,
+                         max_messages=MAX_MESSAGES, max_chars=MAX_CHARS):
+    """
+    Groups a (streamed) sequence of messages into windows.
+    Yields (id, document, metadata); ids are content hashes of the member messages.
+    """
+    max_gap = max_gap_minutes * 60
+    window, chars = [], 0
+    for msg in messages:
+        text = msg['message']
+        if not text or _is_placeholder(text):
+            continue
+        size = len(msg['sender']) + len(text) + 3
+
+        if window and (msg['date'] - window[-1]['date']).total_seconds() > max_gap:
+            yield _window_record(window)
+            window, chars = [], 0
+        elif window and (len(window) >= max_messages or chars + size > max_chars):
+            cut = next((i for i in range(len(window) - 1, 0, -1)
+                        if window[i]['sender'] != window[i - 1]['sender']), len(window))
+            yield _window_record(window[:cut])
+            window = window[cut:]
+            chars = sum(len(m['sender']) + len(m['message']) + 3 for m in window)
+            if window and (len(window) >= max_messages or chars + size > max_chars):
+                yield _window_record(window)
+                window, chars = [], 0
+
+        window.append(msg)
+        chars += size
+    if window:
+        yield _window_record(window)
+
+
+def memory_lines(memory):
+    """Splits a retrieved window back into its "Sender: message" lines."""
+    document = memory['document']
+    offsets = memory['metadata'].get('offsets')
+    if not offsets:
+        # Stored per message (windows=False): one line
+        return [f"{memory['metadata']['sender']}: {document}"]
+    starts = [int(o) for o in offsets.split(",")]
+    ends = [s - 1 for s in starts[1:]] + [len(document)]
+    return [document[s:e] for s, e in zip(starts, ends)]
+
+
+def message_text(document, metadata):
+    """A record's message text without the "Sender: " prefixes (what the lexical index sees)."""
+    if not metadata.get('offsets'):
+        return document          # per-message record: the document is the message
+    lines = memory_lines({'document': document, 'metadata': metadata})
+    return "\n".join(line.split(": ", 1)[-1] for line in lines)   # senders never contain ':'
+
+
+def best_line(memory, query):
+    """The line of a window sharing the most words with the query (first line on ties)."""
+    lines = memory_lines(memory)
+    words = set(_WORD.findall(query.lower()))
+    return max(lines, key=lambda line: len(words & set(_WORD.findall(line.lower()))))
+
+
+def memory_excerpt(memory, query, max_chars):
+    """The best line plus neighbouring lines, as much as fits in max_chars."""
+    lines = memory_lines(memory)
+    center = lines.index(best_line(memory, query))
+    lo = hi = center
+    used = len(lines[center])
+    while True:
+        grew = False
+        for j in (hi + 1, lo - 1):
+            if 0 <= j < len(lines) and not (lo <= j <= hi) and used + len(lines[j]) + 1 <= max_chars:
+                used += len(lines[j]) + 1
+                lo, hi = min(lo, j), max(hi, j)
+                grew = True
+        if not grew:
+            break
+    excerpt = "\n".join(lines[lo:hi + 1])
+    return excerpt if len(excerpt) <= max_chars else excerpt[:max_chars] + "..."
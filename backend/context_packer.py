@@ -0,0 +1,113 @@
+"""
+Sahara context packing
+======================
+Chooses which retrieved memories go into the LLM prompt, and how much of
+each, under a budget counted in real model tokens (any count_tokens(text)
+callable; llm_server passes the llama.cpp tokenizer):
+
+  1. each memory is reduced to its best-matching lines (memory_excerpt)
+  2. near-duplicates are dropped: excerpts whose word sets overlap another,
+     more relevant excerpt by >= duplicate_threshold (Jaccard)
+  3. the rest are picked greedily by maximal marginal relevance
+       lambda * relevance - (1 - lambda) * max similarity to already picked
+     so three retellings of the same evening do not crowd out everything else
+  4. a memory that does not fit the remaining budget is shortened (down to
+     min_chars) or skipped; the packed lines never exceed the budget
+
+Relevance is the retrieval score (rag.retrieve_memories), min-max scaled over
+the candidates, or the rank when no score is present.
+"""
+import re
+
+from chunking import memory_excerpt
+
+_WORD = re.compile(r"\w+")
+
+LAMBDA = 0.7
+DUPLICATE_THRESHOLD = 0.8
+MAX_CHARS = 400          # longest excerpt per memory
+MIN_CHARS = 80           # shorter than this is not worth the tokens
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _relevance(memories):
+    scores = [m.get('score') for m in memories]
+    if not scores:
+        return []
+    if any(s is None for s in scores):
+        n = len(memories)
+        return [1 - i / n for i in range(n)]
+    lo, hi = min(scores), max(scores)
+    return [(s - lo) / (hi - lo) if hi > lo else 1.0 for s in scores]
+
+
+def format_memory(index, memory, excerpt):
+    return f"[{index}] {memory['metadata']['date'][:10]} - {excerpt}\n"
+
+
+def truncate_to_tokens(text, count_tokens, budget):
+    """Longest prefix of text (cut at a word boundary when possible) within budget tokens."""
+    if count_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    space = cut.rfind(" ")
+    return cut[:space] if space > lo // 2 else cut
+
+
+def pack_memories(query, memories, count_tokens, budget, max_memories=4, lambda_=LAMBDA,
+                  duplicate_threshold=DUPLICATE_THRESHOLD, max_chars=MAX_CHARS, min_chars=MIN_CHARS):
+    """
+    Returns (lines, stats): formatted "[i] date - excerpt" lines whose
+    tokens sum to at most `budget`, and counts of what happened.
+    """
+    stats = {"candidates": len(memories), "duplicates": 0, "shortened": 0, "skipped": 0,
+             "packed": 0, "tokens": 0}
+    candidates = []
+    for memory, relevance in zip(memories, _relevance(memories)):
+        excerpt = memory_excerpt(memory, query, max_chars).replace("\n", " / ")
+        words = set(_WORD.findall(excerpt.lower()))
+        if any(_jaccard(words, c[2]) >= duplicate_threshold for c in candidates):
+            stats["duplicates"] += 1
+            continue
+        candidates.append((memory, excerpt, words, relevance))
+
+    lines, picked, used = [], [], 0
+    while candidates and len(lines) < max_memories and budget - used > 0:
+        best = max(range(len(candidates)), key=lambda i: lambda_ * candidates[i][3] - (1 - lambda_) * max(
+            (_jaccard(candidates[i][2], words) for words in picked), default=0.0))
+        memory, excerpt, words, _ = candidates.pop(best)
+
+        line = format_memory(len(lines) + 1, memory, excerpt)
+        tokens = count_tokens(line)
+        if used + tokens > budget:
+            # Shrink proportionally to the room left, then check again
+            chars = int(len(excerpt) * (budget - used) / tokens) - 4
+            line = None
+            if chars >= min_chars:
+                short = memory_excerpt(memory, query, chars).replace("\n", " / ")
+                short_line = format_memory(len(lines) + 1, memory, short)
+                short_tokens = count_tokens(short_line)
+                if used + short_tokens <= budget:
+                    line, tokens = short_line, short_tokens
+                    stats["shortened"] += 1
+            if line is None:
+                stats["skipped"] += 1
+                continue
+
+        lines.append(line)
+        picked.append(words)
+        used += tokens
+
+    stats["packed"] = len(lines)
+    stats["tokens"] = used
+    return lines, stats
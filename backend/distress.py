@@ -0,0 +1,145 @@
+"""
+Sahara distress features
+========================
+Single-pass replacement for the librosa pipeline in voice.analyze_distress
+(librosa.load + pyin + rms + zero_crossing_rate), which decoded the audio a
+second time and ran pYIN's HMM, often slower than real time on CPU.
+
+The signal is framed once (2048-sample frames, hop 512, centred: the same
+framing librosa used) and every feature reads the same frame matrix:
+
+  - RMS energy per frame
+  - zero-crossing rate per frame
+  - F0 by vectorized YIN: the difference function for all frames at once
+    from one batched real FFT, cumulative-mean normalisation, first local
+    minimum under YIN_THRESHOLD, parabolic interpolation; frames with no
+    such minimum (noise, silence) are unvoiced
+
+score_features() applies the original thresholds unchanged, so callers keep
+the { score, level, flags } contract. benchmarks/distress_features.py
+compares both implementations on synthetic tones and noise.
+"""
+import numpy as np
+
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+FMIN = 80
+FMAX = 400
+YIN_THRESHOLD = 0.15
+SILENCE_RMS = 1e-3       # frames quieter than this are never voiced
+
+
+def pcm_to_float(pcm: bytes, rate: int, target_rate: int) -> np.ndarray:
+    """16-bit mono PCM → float32 in [-1, 1] at target_rate (linear resampling)."""
+    audio = np.frombuffer(pcm[:len(pcm) - len(pcm) % 2], dtype=np.int16).astype(np.float32) / 32768.0
+    if rate != target_rate and len(audio):
+        n = int(round(len(audio) * target_rate / rate))
+        audio = np.interp(np.arange(n) * (rate / target_rate), np.arange(len(audio)), audio).astype(np.float32)
+    return audio
+
+
+def frame(audio, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH):
+    """Centred frames (n_frames, frame_length), zero-padded like librosa's center=True."""
+    pad = frame_length // 2
+    padded = np.pad(audio, (pad, pad))
+    if len(padded) < frame_length:
+        padded = np.pad(padded, (0, frame_length - len(padded)))
+    return np.lib.stride_tricks.sliding_window_view(padded, frame_length)[::hop_length]
+
+
+def yin(frames, sr, fmin=FMIN, fmax=FMAX, threshold=YIN_THRESHOLD):
+    """F0 in Hz per frame (NaN where unvoiced), for all frames in one batch."""
+    min_lag = max(int(sr / fmax), 1)
+    max_lag = int(np.ceil(sr / fmin))
+    width = frames.shape[1] - max_lag          # YIN integration window
+    n_fft = 1 << int(np.ceil(np.log2(frames.shape[1] + width)))
+
+    # d(tau) = sum_j (x_j - x_{j+tau})^2 = e(0) + e(tau) - 2 r(tau), all j < width
+    spectrum = np.fft.rfft(frames, n_fft, axis=1)
+    head = np.fft.rfft(frames[:, :width], n_fft, axis=1)
+    cross = np.fft.irfft(spectrum * np.conj(head), n_fft, axis=1)[:, :max_lag + 1]
+    energy = np.cumsum(np.pad(frames.astype(np.float64) ** 2, ((0, 0), (1, 0))), axis=1)
+    lags = np.arange(max_lag + 1)
+    window_energy = energy[:, lags + width] - energy[:, lags]
+    diff = np.maximum(window_energy[:, :1] + window_energy - 2 * cross, 0.0)
+
+    # Cumulative mean normalised difference d'(tau)
+    cmnd = np.ones_like(diff)
+    running = np.cumsum(diff[:, 1:], axis=1)
+    cmnd[:, 1:] = diff[:, 1:] * lags[1:] / np.where(running > 0, running, np.inf)
+    cmnd[:, 1:][running <= 0] = 1.0
+
+    # First local minimum under the threshold within [min_lag, max_lag - 1]
+    inner = cmnd[:, min_lag:max_lag]
+    prev, nxt = cmnd[:, min_lag - 1:max_lag - 1], cmnd[:, min_lag + 1:max_lag + 1]
+    candidates = (inner < threshold) & (inner <= prev) & (inner <= nxt)
+    voiced = candidates.any(axis=1)
+    tau = min_lag + np.argmax(candidates, axis=1)
+
+    # Parabolic interpolation around tau for sub-sample precision
+    rows = np.arange(len(frames))
+    a, b, c = cmnd[rows, tau - 1], cmnd[rows, tau], cmnd[rows, tau + 1]
+    denom = a - 2 * b + c
+    shift = np.where(np.abs(denom) > 1e-12, 0.5 * (a - c) / np.where(denom == 0, 1, denom), 0.0)
+    f0 = sr / (tau + np.clip(shift, -1, 1))
+    return np.where(voiced, f0, np.nan)
+
+
+def extract_features(audio, sr, cancelled=None):
+    """
+    Per-frame rms, zcr and f0 from one shared framing of `audio`.
+    Returns None if the `cancelled` event (threading.Event) is set before
+    the pitch tracker, the expensive part, starts.
+    """
+    frames = frame(audio)
+    rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frames.shape[1]
+    if cancelled is not None and cancelled.is_set():
+        return None
+    f0 = yin(frames, sr)
+    f0[rms < SILENCE_RMS] = np.nan
+    return {"rms": rms, "zcr": zcr, "f0": f0}
+
+
+def score_features(features):
+    """The thresholds voice.analyze_distress has always used → { score, level, flags }."""
+    flags = []
+    score = 0.0
+
+    # Pitch variance (F0)
+    f0_clean = features["f0"][~np.isnan(features["f0"])]
+    if len(f0_clean) > 10:
+        pitch_var = float(np.std(f0_clean))
+        if pitch_var > 60:
+            flags.append("high_pitch_variance")
+            score += 0.35
+
+    # Energy / RMS
+    rms_var = float(np.std(features["rms"]))
+    rms_mean = float(np.mean(features["rms"]))
+    if rms_var > 0.02:
+        flags.append("erratic_energy")
+        score += 0.30
+    if rms_mean > 0.08:
+        flags.append("loud_speech")
+        score += 0.15
+
+    # Speech rate via zero-crossing rate (proxy)
+    zcr_mean = float(np.mean(features["zcr"]))
+    if zcr_mean > 0.15:
+        flags.append("fast_speech_rate")
+        score += 0.20
+
+    score = round(min(score, 1.0), 2)
+    level = "high" if score >= 0.6 else "mild" if score >= 0.3 else "calm"
+
+    return {"score": score, "level": level, "flags": flags}
+
+
+def analyze(audio, sr, cancelled=None):
+    """{ score, level, flags } for float audio at sr, or None if cancelled."""
+    if cancelled is not None and cancelled.is_set():
+        return None
+    features = extract_features(audio, sr, cancelled)
+    return score_features(features) if features is not None else None
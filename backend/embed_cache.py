@@ -0,0 +1,187 @@
+"""
+Sahara embedding cache
+======================
+Sentence embeddings are deterministic per (model, text), and grief chats repeat
+themselves a lot ("miss you", "Missing Aai today"). This cache stores them on
+disk in sqlite, keyed by model name + hash of the normalized text, with an
+in-process LRU in front for hot query embeddings.
+
+  rag.py uses one shared instance for both ingestion and retrieve_memories().
+
+Eviction: when the vectors on disk exceed max_bytes, the least recently used
+rows are deleted until the cache is back under 90% of the limit. Disk hits do
+not write on the read path: their access times are buffered and written with
+the next store, eviction or every TOUCH_BATCH hits (losing a few on exit only
+makes eviction order slightly less exact).
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Buffered last_used updates written in one transaction
+TOUCH_BATCH = 256
+
+
+def normalize_text(text, lowercase=True):
+    """Collapses whitespace (and case, for uncased models like MiniLM) before hashing."""
+    text = ' '.join(text.split())
+    return text.lower() if lowercase else text
+
+
+class EmbeddingCache:
+    def __init__(self, model_name, path, max_bytes=256 * 1024 * 1024, lru_size=1024,
+                 lowercase=True):
+        self.model_name = model_name
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lru_size = lru_size
+        self.lowercase = lowercase
+
+        self._lru = OrderedDict()
+        self._touched = {}       # key -> last_used not yet written
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model     TEXT NOT NULL,
+                key       BLOB NOT NULL,
+                vector    BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, key)
+            ) WITHOUT ROWID""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        self._db.commit()
+        self._disk_bytes = self._db.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, text):
+        normalized = normalize_text(text, self.lowercase)
+        return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+
+    # ── Lookup / store ───────────────────────────────────────────────────────
+    def encode(self, texts, encoder):
+        """
+        Returns a float32 array (len(texts), dim). Only texts missing from the
+        cache are passed to encoder(list_of_texts), once each.
+        """
+        keys = [self._key(t) for t in texts]
+        found = {}
+
+        with self._lock:
+            for key in keys:
+                vec = self._lru.get(key)
+                if vec is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = vec
+            memory_hits = sum(1 for key in keys if key in found)
+
+            wanted = list({key for key in keys if key not in found})
+            now = time.time()
+            for start in range(0, len(wanted), 500):
+                chunk = wanted[start:start + 500]
+                rows = self._db.execute(
+                    "SELECT key, vector FROM embeddings WHERE model = ? AND key IN (%s)"
+                    % ','.join('?' * len(chunk)),
+                    [self.model_name, *chunk]).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                    self._touched[key] = now
+            disk_hits = sum(1 for key in keys if key in found) - memory_hits
+            if len(self._touched) >= TOUCH_BATCH:
+                self._flush_touched()
+                self._db.commit()
+
+        missing = {}
+        for text, key in zip(texts, keys):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = np.asarray(encoder(list(missing.values())), dtype=np.float32)
+            found.update(zip(missing.keys(), vectors))
+            self._store(list(zip(missing.keys(), vectors)))
+
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.disk_hits += disk_hits
+            self.misses += len(texts) - memory_hits - disk_hits
+
+        return np.stack([found[key] for key in keys]) if keys else np.empty((0, 0), np.float32)
+
+    def encode_query(self, text, encoder):
+        """Single-text lookup that also promotes the result into the in-process LRU."""
+        vec = self.encode([text], encoder)[0]
+        key = self._key(text)
+        with self._lock:
+            self._lru[key] = vec
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+        return vec
+
+    def _store(self, items):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(self.model_name, key, vec.tobytes(), now) for key, vec in items])
+            self._disk_bytes += sum(vec.nbytes for _, vec in items)
+            self._flush_touched()
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _flush_touched(self):
+        # Caller holds the lock and commits
+        if self._touched:
+            self._db.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                [(used, self.model_name, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self):
+        # Caller holds the lock; pending access times are already written
+        excess = self._disk_bytes - int(self.max_bytes * 0.9)
+        victims = []
+        for model, key, size in self._db.execute(
+                "SELECT model, key, LENGTH(vector) FROM embeddings ORDER BY last_used"):
+            if excess <= 0:
+                break
+            victims.append((model, key))
+            excess -= size
+            self._disk_bytes -= size
+        self._db.executemany("DELETE FROM embeddings WHERE model = ? AND key = ?", victims)
+        self.evictions += len(victims)
+
+    # ── Introspection ────────────────────────────────────────────────────────
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "disk_bytes": self._disk_bytes,
+            "lru_entries": len(self._lru),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self._touched.clear()
+            self._db.execute("DELETE FROM embeddings")
+            self._db.commit()
+            self._disk_bytes = 0
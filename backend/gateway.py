@@ -0,0 +1,63 @@
+"""
+Sahara gateway
+==============
+One process instead of three Flask apps (llm_server :5000, chat_server
+:5006, voice :5007). Each of those loaded its own copy of the embedding
+model through rag, and voice reached chat over a fresh HTTP connection per
+utterance. Here /chat, /generate and /voice are mounted as blueprints on one
+app, share the models in models.registry, and voice hands transcripts to
+chat_server as a function call.
+
+  python gateway.py                     # http://127.0.0.1:5005, ws://127.0.0.1:5008/stt
+
+The separate servers still run on their own for split deployments; voice
+then reaches /chat at SAHARA_CHAT_URL over a pooled keep-alive session.
+The streaming STT socket defaults to port 5008 in both; set SAHARA_STT_PORT
+for one of them to run voice.py next to the gateway.
+"""
+from flask import Flask, Response, jsonify
+
+import chat_server
+import llm_server
+import telemetry
+import voice
+from models import registry
+
+GATEWAY_PORT = 5005
+
+app = Flask(__name__)
+app.register_blueprint(chat_server.bp)
+app.register_blueprint(llm_server.bp)
+app.register_blueprint(voice.bp)
+
+# Voice → chat without leaving the process
+voice.use_local_chat(chat_server.chat_reply)
+
+REQUIRED_MODELS = list(dict.fromkeys(chat_server.REQUIRED_MODELS + llm_server.REQUIRED_MODELS
+                                     + voice.REQUIRED_MODELS))
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    return jsonify({"status": "ok", "chat": chat_server.health_body(),
+                    "llm": llm_server.health_body(), "voice": voice.health_body()})
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    body, status = registry.readiness(REQUIRED_MODELS)
+    return jsonify(body), status
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(telemetry.render(), content_type=telemetry.CONTENT_TYPE)
+
+
+if __name__ == "__main__":
+    print(f"🌿 Sahara gateway → http://127.0.0.1:{GATEWAY_PORT}  (/chat, /generate, /voice)")
+    print(f"   Streaming STT → ws://127.0.0.1:{voice.STT_WS_PORT}/stt")
+    registry.warmup(REQUIRED_MODELS)
+    llm_server.scheduler.start()
+    voice.start_stt_server()
+    app.run(host="127.0.0.1", port=GATEWAY_PORT, threaded=True)
@@ -0,0 +1,198 @@
+"""
+Sahara lexical index (BM25)
+===========================
+MiniLM is weak on transliterated Marathi/Hindi ("aathvan", "modak"), and every
+dense search pays for a query embedding. This is a BM25 inverted index built
+during ingestion next to the vectors; rag.retrieve_memories uses it as a cheap
+first stage, fuses its scores with the dense ones, and skips the embedding
+entirely when the lexical hits are already conclusive.
+
+Tokens are folded so common transliteration variants collide:
+  aathvan / athavan / aathwan → atvn      tujhi / tuzhi → tuji
+  khup / khoop → kup                       miss / mis → mis
+(lowercase, accents stripped, ee→i, oo→u, w→v, z→j, ph→f, aspirate h dropped,
+repeated letters collapsed, schwa 'a' between consonants dropped). Devanagari
+words are kept as-is. Queries and documents go through the same folding, so it
+only has to be consistent, not linguistically right.
+
+Postings live in sqlite (one file for all collections), so the index is
+incremental: documents are added/removed alongside their vectors. Only message
+text is indexed, not sender names. An index from an older SCHEMA_VERSION is
+dropped on open and backfilled by the next import.
+"""
+import math
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Terms in more than this share of documents carry almost no IDF; their postings
+# are not fetched. A query made only of such terms gets no lexical hits.
+MAX_DF_RATIO = 0.5
+# Bump when what gets indexed changes (2: sender names no longer indexed)
+SCHEMA_VERSION = 2
+
+_WORD = re.compile(r"\w+")
+_ASPIRATE = re.compile(r"([bcdgjkpst])h")
+_REPEAT = re.compile(r"(.)\1+")
+_SCHWA = re.compile(r"(?<=[^aeiou])a(?=[^aeiou])")
+
+STOPWORDS = {
+    # English
+    "a", "an", "the", "is", "am", "are", "was", "i", "you", "me", "my", "to", "of", "and",
+    "in", "it", "for", "on", "so", "do", "be", "at", "this", "that", "with",
+    # Hinglish / Marathi in Latin script
+    "hai", "hain", "ho", "ka", "ki", "ke", "ko", "se", "mein", "main", "hi", "bhi", "na",
+    "nahi", "aahe", "ahe", "ani", "la", "pan", "mi", "tu", "ye",
+}
+
+
+@lru_cache(maxsize=65536)
+def fold(word):
+    """Transliteration-folds one lowercase word (cached: chat vocabularies are small)."""
+    if not word.isascii():
+        stripped = ''.join(c for c in unicodedata.normalize('NFKD', word) if not unicodedata.combining(c))
+        if not stripped.isascii():
+            return stripped          # Devanagari etc.: keep
+        word = stripped
+    word = word.replace("ee", "i").replace("oo", "u").replace("ph", "f")
+    word = word.replace("w", "v").replace("z", "j").replace("q", "k")
+    word = _ASPIRATE.sub(r"\1", word)
+    word = _REPEAT.sub(r"\1", word)
+    if len(word) > 3:
+        word = word[0] + _SCHWA.sub("", word[1:])
+    return word
+
+
+def tokenize(text):
+    return [fold(w) for w in _WORD.findall(text.lower()) if w not in STOPWORDS and len(w) > 1]
+
+
+class LexicalIndex:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self._db.executescript("DROP TABLE IF EXISTS postings; DROP TABLE IF EXISTS docs; "
+                                   "DROP TABLE IF EXISTS stats; PRAGMA user_version = %d;" % SCHEMA_VERSION)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS postings (
+                collection TEXT NOT NULL,
+                term       TEXT NOT NULL,
+                doc_id     TEXT NOT NULL,
+                tf         INTEGER NOT NULL,
+                dl         INTEGER NOT NULL,
+                PRIMARY KEY (collection, term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS docs (
+                collection TEXT NOT NULL,
+                doc_id     TEXT NOT NULL,
+                terms      TEXT NOT NULL,
+                length     INTEGER NOT NULL,
+                PRIMARY KEY (collection, doc_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS stats (
+                collection TEXT PRIMARY KEY,
+                n_docs     INTEGER NOT NULL,
+                total_len  INTEGER NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    # ── Writes (called by create_vector_store) ───────────────────────────────
+    def missing(self, collection, ids):
+        """Ids not yet indexed (e.g. a store built before the lexical index existed)."""
+        with self._lock:
+            found = set()
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                found.update(row[0] for row in self._db.execute(
+                    "SELECT doc_id FROM docs WHERE collection = ? AND doc_id IN (%s)" % ','.join('?' * len(chunk)),
+                    [collection, *chunk]))
+        return [doc_id for doc_id in ids if doc_id not in found]
+
+    def add(self, collection, ids, documents):
+        rows, docs, total = [], [], 0
+        for doc_id, document in zip(ids, documents):
+            terms = Counter(tokenize(document))
+            length = sum(terms.values())
+            total += length
+            rows.extend((collection, term, doc_id, tf, length) for term, tf in terms.items())
+            docs.append((collection, doc_id, ' '.join(terms), length))
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO postings VALUES (?, ?, ?, ?, ?)", rows)
+            self._db.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?)", docs)
+            self._db.execute("""
+                INSERT INTO stats VALUES (?, ?, ?) ON CONFLICT(collection)
+                DO UPDATE SET n_docs = n_docs + excluded.n_docs, total_len = total_len + excluded.total_len""",
+                (collection, len(docs), total))
+            self._db.commit()
+
+    def ids(self, collection):
+        """All document ids indexed in a collection."""
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT doc_id FROM docs WHERE collection = ?",
+                                                       (collection,))]
+
+    def delete(self, collection, ids):
+        with self._lock:
+            removed = removed_len = 0
+            for doc_id in ids:
+                row = self._db.execute("SELECT terms, length FROM docs WHERE collection = ? AND doc_id = ?",
+                                       (collection, doc_id)).fetchone()
+                if row is None:
+                    continue
+                terms = row[0].split()
+                removed_len += row[1]
+                self._db.executemany("DELETE FROM postings WHERE collection = ? AND term = ? AND doc_id = ?",
+                                     [(collection, term, doc_id) for term in terms])
+                self._db.execute("DELETE FROM docs WHERE collection = ? AND doc_id = ?", (collection, doc_id))
+                removed += 1
+            if removed:
+                self._db.execute("UPDATE stats SET n_docs = n_docs - ?, total_len = total_len - ? "
+                                 "WHERE collection = ?", (removed, removed_len, collection))
+            self._db.commit()
+
+    # ── Search ───────────────────────────────────────────────────────────────
+    def search(self, collection, query, limit):
+        """
+        Returns (terms, hits): the distinct informative query terms and up to
+        `limit` (doc_id, bm25_score, matched_term_count) tuples, best first.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return terms, []
+        with self._lock:
+            stats = self._db.execute("SELECT n_docs, total_len FROM stats WHERE collection = ?",
+                                     (collection,)).fetchone()
+            if not stats or not stats[0]:
+                return terms, []
+            n_docs, avgdl = stats[0], stats[1] / stats[0]
+            df = {term: self._db.execute(
+                "SELECT COUNT(*) FROM postings WHERE collection = ? AND term = ?",
+                (collection, term)).fetchone()[0] for term in terms}
+            # Unknown terms (df 0) stay: they count against coverage in the caller
+            informative = [t for t in terms if df[t] <= MAX_DF_RATIO * n_docs]
+            if not informative:
+                return terms, []
+            terms = informative
+            postings = {term: self._db.execute(
+                "SELECT doc_id, tf, dl FROM postings WHERE collection = ? AND term = ?",
+                (collection, term)).fetchall() for term in terms}
+
+        scores, matched = {}, Counter()
+        for rows in postings.values():
+            if not rows:
+                continue
+            idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            for doc_id, tf, dl in rows:
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * dl / avgdl))
+                matched[doc_id] += 1
+        best = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        return terms, [(doc_id, score, matched[doc_id]) for doc_id, score in best]
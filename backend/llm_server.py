@@ -1,7 +1,17 @@
 import os
 import json
-from flask import Flask, request, jsonify
-from llama_cpp import Llama 
+import threading
+from time import perf_counter
+from flask import Blueprint, Flask, Response, request, jsonify, stream_with_context
+from models import registry
+from prefix_cache import PrefixCache
+from scheduler import InferenceScheduler, QueueFull, DeadlineExceeded, JobCancelled, SchedulerClosed
+from context_packer import pack_memories, truncate_to_tokens
+from response_cache import ResponseCache
+from safety import is_crisis
+import telemetry
+import rag
+from rag import retrieve_memories  # Phase 1 retrieval (cheap to import; registers the embedder)
 
 # ────────────────────────────────────────────────
 # CONFIG - Adjust these for your setup
@@ -9,7 +19,30 @@ from llama_cpp import Llama
 
 MODEL_PATH = "./models/phi-3-mini-4k-instruct-q4.gguf"         
 
-LLM = None  # Will load lazily
+LLM = None  # Will load lazily (or via background warmup at startup)
+
+N_CTX = 2048                # context window; prompt + reply never exceed it
+CONTEXT_TOKENS = 400        # most tokens spent on retrieved memories (shorter prompt = faster prefill)
+MAX_MEMORIES = 4            # memories packed into one prompt
+RETRIEVE_K = 8              # candidates fetched for the packer to choose from
+
+# Semantic response cache (see response_cache.py): reuse the answer to a near-identical
+# query over the same memories. Off unless SAHARA_RESPONSE_CACHE=1.
+RESPONSE_CACHE = os.environ.get("SAHARA_RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_THRESHOLD = float(os.environ.get("SAHARA_RESPONSE_CACHE_THRESHOLD", "0.92"))
+
+# Inference scheduling (see scheduler.py). Each instance holds its own copy of
+# the model, so instances x threads should not exceed the CPU cores.
+LLM_INSTANCES = int(os.environ.get("SAHARA_LLM_INSTANCES", "1"))
+LLM_THREADS = int(os.environ.get("SAHARA_LLM_THREADS", "4"))        # per instance
+MAX_QUEUE = int(os.environ.get("SAHARA_LLM_QUEUE", "8"))            # waiting requests before 429
+DEADLINE_S = float(os.environ.get("SAHARA_LLM_DEADLINE", "60"))     # default and longest per-request deadline
+
+# Lower numbers are served first. Clients may only lower their own priority
+# (e.g. background requests); crisis inputs are put ahead of everything by the server.
+CRISIS_PRIORITY = 0
+DEFAULT_PRIORITY = 1
+LOWEST_PRIORITY = 9
 
 # ChromaDB collection name from Phase 1
 COLLECTION_NAME = 'sahara_memories'
@@ -47,41 +80,74 @@ Keep responses warm, short (80-150 words), and in simple Hindi/English mix if us
 # Helper: Load LLM lazily (heavy, do once)
 # ────────────────────────────────────────────────
 
+def _load_llm_model():
+    from llama_cpp import Llama
+    return Llama(
+        model_path=MODEL_PATH,
+        n_ctx=N_CTX,             # context length
+        n_threads=LLM_THREADS,   # adjust for mobile CPU cores
+        n_gpu_layers=0,          # 0 = CPU only; >0 if Metal/CUDA available
+        verbose=False
+    )
+
+registry.register("llm", _load_llm_model)
+
+# Models /generate needs: the LLM plus rag's embedder for retrieval
+REQUIRED_MODELS = ["llm", "embedder"]
+
 def load_llm():
     global LLM
     if LLM is None:
-        print("Loading quantized LLM... (may take 10-30s first time)")
-        LLM = Llama(
-            model_path=MODEL_PATH,
-            n_ctx=2048,              # context length
-            n_threads=4,             # adjust for mobile CPU cores
-            n_gpu_layers=0,          # 0 = CPU only; >0 if Metal/CUDA available
-            verbose=False
-        )
-        print("LLM loaded.")
+        LLM = registry.get("llm")
     return LLM
 
+# KV snapshot of SYSTEM_PROMPT per instance: each request only prefills its own part
+prefix_caches = [PrefixCache(MODEL_PATH) for _ in range(LLM_INSTANCES)]
+
+def _load_instance(slot):
+    # Slot 0 is the registry's model (so /ready reflects it); extra slots load their own copy
+    llm = load_llm() if slot == 0 else _load_llm_model()
+    return llm, prefix_caches[slot]
+
+# Every generation goes through here: one worker per instance, bounded priority queue
+scheduler = InferenceScheduler(_load_instance, instances=LLM_INSTANCES, max_queue=MAX_QUEUE)
+
+response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """The response cache, opened under rag.CHROMA_PATH on first use; None unless RESPONSE_CACHE."""
+    global response_cache
+    if RESPONSE_CACHE and response_cache is None:
+        with _response_cache_lock:
+            if response_cache is None:
+                os.makedirs(rag.CHROMA_PATH, exist_ok=True)
+                response_cache = ResponseCache(os.path.join(rag.CHROMA_PATH, "response_cache.sqlite3"),
+                                               threshold=RESPONSE_CACHE_THRESHOLD)
+    return response_cache
+
 # ────────────────────────────────────────────────
 # Core: Generate empathetic response
 # ────────────────────────────────────────────────
 
-def generate_response(query, retrieved_memories):
-    load_llm()  # Ensure loaded
+# Sampling settings shared by the blocking and streaming paths
+GENERATION_PARAMS = dict(
+    max_tokens=200,
+    temperature=0.7,
+    top_p=0.9,
+    stop=["</s>", "\n\n"],  # Prevent rambling
+    echo=False
+)
 
-    # Format retrieved memories safely
-    context_str = ""
-    if retrieved_memories:
-        context_str = "Relevant memories from your chats:\n"
-        for i, mem in enumerate(retrieved_memories[:3], 1):  # Top 3 max
-            date_short = mem['metadata']['date'][:10]
-            sender = mem['metadata']['sender']
-            msg = mem['document'][:200] + "..." if len(mem['document']) > 200 else mem['document']
-            context_str += f"[{i}] {date_short} - {sender}: {msg}\n"
+# Artifact the model likes to prefix its turns with
+SPEAKER_PREFIX = "Sahara: "
 
-    else:
-        context_str = "No specific memories found for this moment."
+MEMORY_HEADER = "Relevant memories from your chats:\n"
+NO_MEMORIES = "No specific memories found for this moment."
 
-    full_prompt = f"""{SYSTEM_PROMPT}
+def build_prompt(query, context_str):
+    """The per-request part of the prompt; it follows SYSTEM_PROMPT."""
+    return f"""
 
 User said: "{query}"
 
@@ -89,55 +155,345 @@ User said: "{query}"
 
 Now respond gently and safely:"""
 
-    # Generate
-    response = LLM(
-        full_prompt,
-        max_tokens=200,
-        temperature=0.7,
-        top_p=0.9,
-        stop=["</s>", "\n\n"],  # Prevent rambling
-        echo=False
-    )
+def pack_prompt(instance, query, retrieved_memories, stats=None):
+    """
+    Token prompt for one request: the cached SYSTEM_PROMPT prefix plus the
+    query and as many distinct memories as fit (context_packer), counted with
+    the model's own tokenizer so prompt + reply always fit in n_ctx.
+    """
+    llm, cache = instance
+    def count_tokens(text):
+        # Same tokenization PrefixCache.prepare applies to the request part
+        return len(llm.tokenize(text.encode('utf-8'), add_bos=False, special=True))
+
+    prefix_tokens = len(llm.tokenize(SYSTEM_PROMPT.encode('utf-8'), add_bos=True, special=True))
+    room = llm.n_ctx() - GENERATION_PARAMS["max_tokens"] - prefix_tokens
+    template = max(count_tokens(build_prompt("", MEMORY_HEADER)), count_tokens(build_prompt("", NO_MEMORIES)))
+    query = truncate_to_tokens(query, count_tokens, max(room - template, 0))
+    budget = min(CONTEXT_TOKENS, room - count_tokens(build_prompt(query, MEMORY_HEADER)))
+    lines, packing = pack_memories(query, retrieved_memories, count_tokens, budget, MAX_MEMORIES)
+
+    # Pieces were counted separately; if joining them changed the total, drop
+    # memories first, then shorten the query
+    while True:
+        rest = build_prompt(query, MEMORY_HEADER + "".join(lines) if lines else NO_MEMORIES)
+        rest_tokens = count_tokens(rest)
+        if rest_tokens <= room:
+            break
+        if lines:
+            packing["tokens"] -= count_tokens(lines.pop())
+            packing["packed"] -= 1
+        elif query:
+            query = truncate_to_tokens(query, count_tokens, count_tokens(query) - (rest_tokens - room))
+        else:
+            raise ValueError("prompt template does not fit in the context window")
+
+    if stats is not None:
+        stats['prompt_tokens'] = prefix_tokens + rest_tokens
+        stats['context'] = packing
+    return cache.prepare(llm, SYSTEM_PROMPT, rest)
+
+def generate_response(query, retrieved_memories, timings=None, priority=1, deadline_s=DEADLINE_S):
+    """
+    Blocking generation through the scheduler. Raises QueueFull when the
+    queue is full and DeadlineExceeded when no answer is ready in time.
+    `timings` (optional dict) receives queue_wait_ms, generation_ms and
+    the generation stats of stream_pieces.
+    """
+    stats = {}
+    job = submit_generation(query, retrieved_memories, stats, priority, deadline_s)
+    generated_text = "".join(job.results())
+    if timings is not None:
+        timings.update(job.timings(), **stats)
+    return generated_text
 
-    generated_text = response['choices'][0]['text'].strip()
+def submit_generation(query, retrieved_memories, stats=None, priority=1, deadline_s=DEADLINE_S):
+    """Queues a generation; the returned Job yields cleaned text pieces from job.results()."""
+    parent = telemetry.current()
+    return scheduler.submit(lambda instance: stream_pieces(instance, query, retrieved_memories, stats, parent),
+                            priority=priority, deadline_s=deadline_s)
 
-    # Clean up common artifacts
-    generated_text = generated_text.replace("Sahara: ", "").strip()
+# ────────────────────────────────────────────────
+# Streaming: same output as generate_response, token by token
+# ────────────────────────────────────────────────
 
-    return generated_text
+class StreamCleaner:
+    """
+    Incremental version of generate_response's post-processing.
+    feed() takes raw token text and returns what is safe to show now: any
+    tail that could still turn into SPEAKER_PREFIX or a stop sequence, and
+    the whitespace before it (or trailing whitespace on its own), is held
+    back until the next token decides it.
+    """
+    def __init__(self, stops):
+        self.stops = [s for s in stops if s]
+        self.markers = self.stops + [SPEAKER_PREFIX]
+        self.buffer = ""
+        self.started = False   # leading whitespace already skipped
+        self.stopped = False
+
+    def _held_back(self):
+        held = 0
+        for marker in self.markers:
+            for n in range(min(len(marker) - 1, len(self.buffer)), held, -1):
+                if self.buffer.endswith(marker[:n]):
+                    held = n
+                    break
+        # Whitespace in front of a possible marker goes with it: if the marker
+        # turns out to be a stop sequence, finish() drops that whitespace
+        rest = self.buffer[:len(self.buffer) - held]
+        return held + len(rest) - len(rest.rstrip())
+
+    def feed(self, text):
+        if self.stopped:
+            return ""
+        self.buffer += text
+        cut = min((i for i in (self.buffer.find(s) for s in self.stops) if i >= 0), default=-1)
+        if cut >= 0:
+            self.buffer = self.buffer[:cut]
+            self.stopped = True
+        self.buffer = self.buffer.replace(SPEAKER_PREFIX, "")
+        if not self.started:
+            self.buffer = self.buffer.lstrip()
+            self.started = bool(self.buffer)
+        if self.stopped:
+            return self.finish()
+        keep = self._held_back()
+        out, self.buffer = self.buffer[:len(self.buffer) - keep], self.buffer[len(self.buffer) - keep:]
+        return out
+
+    def finish(self):
+        out, self.buffer = self.buffer.rstrip(), ""
+        if not self.started:
+            out = out.lstrip()
+        return out
+
+def stream_pieces(instance, query, retrieved_memories, stats=None, parent=None):
+    """
+    Runs on a scheduler worker: yields cleaned text pieces as llama.cpp
+    produces them on `instance` (llm, prefix_cache). Closing the generator
+    (client went away, deadline passed) closes the llama.cpp stream, which
+    stops token generation. `stats` (optional dict) receives ttft_ms,
+    total_ms, tokens, prompt_tokens and the context packing counts, plus
+    complete=True once the whole answer was produced (only then is it cacheable).
+    `parent` is the trace context of the request (telemetry.current()).
+    """
+    llm = instance[0]
+    start = perf_counter()
+    cleaner = StreamCleaner(GENERATION_PARAMS["stop"])
+    tokens = 0
+    first_token = None
+    prompt = pack_prompt(instance, query, retrieved_memories, stats)
+    packed = perf_counter()
+    chunks = llm(prompt, stream=True, **GENERATION_PARAMS)
+    try:
+        for chunk in chunks:
+            tokens += 1
+            if first_token is None:
+                first_token = perf_counter()   # llama.cpp evaluates the prompt before the first token
+            piece = cleaner.feed(chunk['choices'][0]['text'])
+            if piece:
+                if stats is not None and 'ttft_ms' not in stats:
+                    stats['ttft_ms'] = round((perf_counter() - start) * 1000, 1)
+                yield piece
+            if cleaner.stopped:
+                break
+        piece = cleaner.finish()
+        if piece:
+            yield piece
+        if stats is not None:
+            stats['complete'] = True   # never reached when the consumer stopped early
+    finally:
+        chunks.close()
+        end = perf_counter()
+        if stats is not None:
+            stats['tokens'] = tokens
+            stats['total_ms'] = round((end - start) * 1000, 1)
+        if telemetry.ENABLED:
+            _record_generation(start, packed, first_token, end, tokens, len(prompt), parent)
+
+def _record_generation(start, packed, first_token, end, tokens, prompt_tokens, parent):
+    """Stage spans and token metrics for one generation (counts only, never text)."""
+    generation = telemetry.stage("llm.generate", start, end, parent=parent,
+                                 prompt_tokens=prompt_tokens, tokens=tokens)
+    telemetry.stage("llm.pack_prompt", start, packed, parent=generation)
+    telemetry.TOKENS.inc(prompt_tokens, "prompt")
+    telemetry.TOKENS.inc(tokens, "generated")
+    if first_token is None:
+        return
+    telemetry.stage("llm.prefill", packed, first_token, parent=generation)
+    telemetry.stage("llm.decode", first_token, end, parent=generation)
+    telemetry.TTFT_SECONDS.observe(first_token - start)
+    if tokens > 1 and end > first_token:
+        telemetry.TOKENS_PER_SECOND.observe((tokens - 1) / (end - first_token))
+
+def _sse(data, event=None):
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 # ────────────────────────────────────────────────
 # Flask API for Flutter bridge
 # ────────────────────────────────────────────────
 
-app = Flask(__name__)
+# /generate lives on a blueprint so gateway.py can mount it next to /chat and /voice
+bp = Blueprint("llm", __name__)
 
-@app.route('/generate', methods=['POST'])
+@bp.route('/generate', methods=['POST'])
+@telemetry.traced("llm.request", headers=lambda: request.headers)
 def api_generate():
     try:
         data = request.json
         query = data.get('query', '').strip()
         if not query:
             return jsonify({"error": "No query provided"}), 400
+        try:
+            priority, deadline_s = _scheduling(data, query)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         # Retrieve from Phase 1 (assumes ChromaDB already populated)
-        from phase1_rag import retrieve_memories  # Import your Phase 1 script as module
-        memories = retrieve_memories(query, COLLECTION_NAME, top_k=5)
-
-        response_text = generate_response(query, memories)
+        retrieval_timings = {}
+        memories, query_embedding = retrieve_memories(query, COLLECTION_NAME, top_k=RETRIEVE_K,
+                                                      timings=retrieval_timings, with_embedding=True)
+
+        # Same question over the same memories: answer from the cache (never for crisis
+        # inputs). Only when retrieval embedded the query: the lexical stage alone is
+        # cheap, and embedding here just for the lookup would undo its saving
+        cache_key = None
+        if get_response_cache() is not None and query_embedding is not None and not is_crisis(query):
+            cache_key = (query_embedding, [m['id'] for m in memories])
+            cached = response_cache.lookup(*cache_key)
+            if cached is not None:
+                if data.get('stream'):
+                    return _stream_api(query, memories, retrieval_timings, cached=cached)
+                return jsonify({
+                    "response": cached,
+                    "retrieved_count": len(memories),
+                    "memories_sample": [m['document'][:80] + "..." for m in memories[:2]],
+                    "retrieval_timings": retrieval_timings,
+                    "cached": True
+                })
+
+        if data.get('stream'):
+            return _stream_api(query, memories, retrieval_timings, priority, deadline_s, cache_key)
+
+        timings = {}
+        response_text = generate_response(query, memories, timings, priority, deadline_s)
+        complete = timings.pop('complete', False)
+        if cache_key is not None and response_text and complete:
+            response_cache.store(*cache_key, response_text, timings['generation_ms'])
 
         return jsonify({
             "response": response_text,
             "retrieved_count": len(memories),
-            "memories_sample": [m['document'][:80] + "..." for m in memories[:2]]  # for debug
+            "memories_sample": [m['document'][:80] + "..." for m in memories[:2]],  # for debug
+            "retrieval_timings": retrieval_timings,
+            "timings": timings,
+            "cached": False
         })
 
+    except QueueFull as e:
+        return _overloaded(e, 429)
+    except (DeadlineExceeded, JobCancelled, SchedulerClosed) as e:
+        return _overloaded(e, 503)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _scheduling(data, query):
+    """
+    (priority, deadline_s) for a /generate body. "priority" must be an integer
+    from DEFAULT_PRIORITY to LOWEST_PRIORITY and "deadline_ms" (queueing +
+    generation) a positive number, capped at DEADLINE_S. Raises ValueError.
+    """
+    priority = data.get('priority', DEFAULT_PRIORITY)
+    if isinstance(priority, bool) or not isinstance(priority, int) \
+            or not DEFAULT_PRIORITY <= priority <= LOWEST_PRIORITY:
+        raise ValueError(f"priority must be an integer from {DEFAULT_PRIORITY} to {LOWEST_PRIORITY}")
+    deadline_ms = data.get('deadline_ms', DEADLINE_S * 1000)
+    if isinstance(deadline_ms, bool) or not isinstance(deadline_ms, (int, float)) or not deadline_ms > 0:
+        raise ValueError("deadline_ms must be a positive number")
+    if is_crisis(query):
+        priority = CRISIS_PRIORITY
+    return priority, min(deadline_ms / 1000, DEADLINE_S)
+
+def _overloaded(error, status):
+    response = jsonify({"error": str(error), "scheduler": scheduler.stats()})
+    response.status_code = status
+    response.headers["Retry-After"] = "2"
+    return response
+
+def _stream_api(query, memories, retrieval_timings, priority=1, deadline_s=DEADLINE_S,
+                cache_key=None, cached=None):
+    """
+    SSE variant of /generate (POST {"query": ..., "stream": true}):
+      data: {"token": "..."}              one per cleaned text piece
+      event: done   data: {...}           retrieval count/timings, queue wait and generation stats
+      event: error  data: {"error": ...}
+    The job is queued before the response starts, so a full queue is still a
+    plain 429. When the client disconnects the WSGI server closes this
+    generator, which cancels the job and with it the llama.cpp stream.
+    A `cached` answer is sent as a single token; a completed fresh answer
+    is stored under `cache_key`.
+    """
+    if cached is not None:
+        def events():
+            yield _sse({"token": cached})
+            yield _sse({"retrieved_count": len(memories), "retrieval_timings": retrieval_timings,
+                        "cached": True}, event="done")
+        return Response(events(), mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    stats = {}
+    job = submit_generation(query, memories, stats, priority, deadline_s)
+
+    def events():
+        pieces = job.results()
+        text = []
+        try:
+            for piece in pieces:
+                text.append(piece)
+                yield _sse({"token": piece})
+        except Exception as e:
+            yield _sse({"error": str(e)}, event="error")
+            return
+        finally:
+            pieces.close()
+        timings = dict(job.timings(), **stats)
+        # Only a whole answer is cached: a stopped generation can still end without an error
+        if timings.pop('complete', False) and cache_key is not None and text:
+            response_cache.store(*cache_key, "".join(text), timings['generation_ms'])
+        yield _sse({
+            "retrieved_count": len(memories),
+            "retrieval_timings": retrieval_timings,
+            "timings": timings,
+            "cached": False
+        }, event="done")
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def health_body():
+    return {"status": "ok", "llm_loaded": registry.is_loaded("llm"),
+            "scheduler": scheduler.stats(),
+            "prefix_cache": [cache.stats() for cache in prefix_caches],
+            "response_cache": response_cache.stats() if response_cache else None}
+
+# Standalone server (gateway.py serves the same routes in one process)
+app = Flask(__name__)
+app.register_blueprint(bp)
+
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({"status": "ok", "llm_loaded": LLM is not None})
+    return jsonify(health_body())
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    body, status = registry.readiness(REQUIRED_MODELS)
+    return jsonify(body), status
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(telemetry.render(), content_type=telemetry.CONTENT_TYPE)
 
 # ────────────────────────────────────────────────
 # Run server (for hackathon demo)
@@ -147,4 +503,7 @@ if __name__ == '__main__':
     print("Starting Sahara Phase 2 backend server on http://localhost:5000")
     print("Make sure Phase 1 ran first and ./chroma_db exists")
     print("Flutter should POST to /generate with JSON: {'query': 'Missing Aai today'}")
+    print("Add 'stream': true to receive tokens as Server-Sent Events")
+    registry.warmup(REQUIRED_MODELS)
+    scheduler.start()
     app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""
+Sahara model registry
+=====================
+Heavy models (SentenceTransformer, Vosk, the GGUF LLM) are registered here by
+name and loaded on first use or by a background warmup, so a server process
+starts in well under a second and can answer /health while they load.
+
+  registry.register("embedder", lambda: SentenceTransformer(...))
+  registry.warmup(["embedder"])          # background thread
+  model = registry.get("embedder")       # blocks until loaded
+
+Each model records its state (idle / loading / ready / failed) and load time;
+status() backs the /ready endpoints of chat_server, llm_server and voice.
+"""
+import threading
+import time
+
+
+class _Entry:
+    def __init__(self, loader):
+        self.loader = loader
+        self.model = None
+        self.state = "idle"
+        self.load_seconds = None
+        self.error = None
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader):
+        """Registers a zero-argument loader. Re-registering an unloaded name replaces it."""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.model is None:
+                self._entries[name] = _Entry(loader)
+
+    def get(self, name):
+        """Returns the model, loading it on this thread if nobody has yet."""
+        entry = self._entries[name]
+        if entry.model is not None:
+            return entry.model
+        with entry.lock:
+            if entry.model is None:
+                print(f"Loading model '{name}'...")
+                entry.state = "loading"
+                entry.error = None
+                start = time.perf_counter()
+                try:
+                    entry.model = entry.loader()
+                except Exception as e:
+                    entry.state = "failed"
+                    entry.error = str(e)
+                    raise
+                entry.load_seconds = round(time.perf_counter() - start, 3)
+                entry.state = "ready"
+                print(f"Model '{name}' loaded in {entry.load_seconds}s.")
+        return entry.model
+
+    def is_loaded(self, name):
+        entry = self._entries.get(name)
+        return entry is not None and entry.model is not None
+
+    def warmup(self, names=None, background=True):
+        """Loads the given (default: all) models, in a daemon thread unless background=False."""
+        names = list(self._entries) if names is None else list(names)
+
+        def run():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Warmup of '{name}' failed: {e}")
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self, names=None):
+        names = list(self._entries) if names is None else names
+        out = {}
+        for name in names:
+            entry = self._entries.get(name)
+            if entry is None:
+                out[name] = {"state": "unregistered"}
+                continue
+            out[name] = {"state": entry.state, "load_seconds": entry.load_seconds}
+            if entry.error:
+                out[name]["error"] = entry.error
+        return out
+
+    def ready(self, names):
+        return all(self.is_loaded(name) for name in names)
+
+    def readiness(self, names):
+        """(body, http_status) for a /ready endpoint that requires `names`."""
+        ok = self.ready(names)
+        return {"ready": ok, "models": self.status(names)}, (200 if ok else 503)
+
+
+# Process-wide registry shared by rag, llm_server and voice
+registry = ModelRegistry()
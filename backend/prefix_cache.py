@@ -0,0 +1,87 @@
+"""
+Sahara prompt-prefix KV cache
+=============================
+Every /generate prompt starts with the same ~500-token SYSTEM_PROMPT, and on
+a 4-thread CPU evaluating it is most of the prefill time. PrefixCache
+evaluates the prefix once per model instance, snapshots the llama.cpp state
+(save_state) and hands llama.cpp a token prompt that starts with exactly
+those tokens:
+
+  - if the live KV cache still starts with the prefix (the usual case right
+    after a previous request), llama.cpp's own prefix match reuses it and
+    nothing is copied
+  - otherwise the snapshot is restored (load_state), which is a memcpy
+    instead of a 500-token forward pass
+
+Prefix and request text are tokenized separately and concatenated, so the
+prefix tokens are identical on every call regardless of what follows them.
+The snapshot is rebuilt automatically when the prefix text, the model
+instance or the GGUF file (path / mtime) changes.
+
+stats() reports hits, restores, rebuilds and prefill tokens saved.
+"""
+import hashlib
+import os
+import threading
+
+
+class PrefixCache:
+    def __init__(self, model_path=None):
+        self.model_path = model_path
+        self._key = None
+        self._tokens = None
+        self._state = None
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "live_hits": 0, "restores": 0, "rebuilds": 0,
+                       "prefix_tokens": 0, "prefill_tokens_saved": 0, "prefill_tokens_evaluated": 0}
+
+    def _cache_key(self, llm, prefix):
+        mtime = None
+        if self.model_path and os.path.exists(self.model_path):
+            mtime = os.path.getmtime(self.model_path)
+        return (id(llm), self.model_path, mtime, hashlib.blake2b(prefix.encode('utf-8')).hexdigest())
+
+    def _rebuild(self, llm, prefix, key):
+        tokens = llm.tokenize(prefix.encode('utf-8'), add_bos=True, special=True)
+        llm.reset()
+        llm.eval(tokens)
+        self._state = llm.save_state()
+        self._tokens = tokens
+        self._key = key
+        self._stats["rebuilds"] += 1
+        self._stats["prefix_tokens"] = len(tokens)
+
+    def prepare(self, llm, prefix, rest):
+        """
+        Makes `llm` ready to continue after `prefix` and returns the full
+        token prompt (prefix tokens + tokens of `rest`) to pass to llm(...).
+        Call with the model instance locked: it changes the model's state.
+        """
+        with self._lock:
+            key = self._cache_key(llm, prefix)
+            rebuilt = key != self._key
+            if rebuilt:
+                self._rebuild(llm, prefix, key)
+            n = len(self._tokens)
+            if not rebuilt:
+                if llm.n_tokens >= n and list(llm.input_ids[:n]) == self._tokens:
+                    self._stats["live_hits"] += 1
+                else:
+                    llm.load_state(self._state)
+                    self._stats["restores"] += 1
+                self._stats["prefill_tokens_saved"] += n
+            rest_tokens = llm.tokenize(rest.encode('utf-8'), add_bos=False, special=True)
+            self._stats["requests"] += 1
+            self._stats["prefill_tokens_evaluated"] += len(rest_tokens) + (n if rebuilt else 0)
+            return self._tokens + rest_tokens
+
+    def invalidate(self):
+        with self._lock:
+            self._key = self._tokens = self._state = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["prefill_tokens_saved"] + stats["prefill_tokens_evaluated"]
+        stats["prefill_saved_ratio"] = round(stats["prefill_tokens_saved"] / total, 3) if total else 0.0
+        return stats
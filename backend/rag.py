@@ -1,157 +1,501 @@
 import re
 import os
+import json
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
 from datetime import datetime
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
+from itertools import chain
+from typing import NamedTuple
 import numpy as np  # For potential cosine similarity if needed
+from chunking import conversation_windows, best_line, message_text
+from embed_cache import EmbeddingCache
+from lexical import LexicalIndex
+from models import registry
+import telemetry
+from store import StoreManager
+from vector_index import NumpyStore
 
-# Initialize the embedding model (use a lightweight model suitable for on-device)
-embedder = SentenceTransformer('all-MiniLM-L6-v2')  # Or a quantized version for mobile
+# Embedding model (use a lightweight model suitable for on-device).
+# Loaded on first use or by registry.warmup(); importing rag stays cheap.
+EMBED_MODEL_NAME = 'all-MiniLM-L6-v2'
 
-# Function to parse WhatsApp chat export (_chat.txt)
-def parse_whatsapp_chat(file_path):
+def _load_embedder():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBED_MODEL_NAME)  # Or a quantized version for mobile
+
+registry.register("embedder", _load_embedder)
+
+def get_embedder():
+    return registry.get("embedder")
+
+# Everything on disk lives under CHROMA_PATH and is opened on first use, so
+# importing rag touches no files; set rag.CHROMA_PATH before then to relocate it.
+CHROMA_PATH = "./chroma_db"
+
+# Vector store backend: "chroma" (default), or the in-process exact index from
+# vector_index.py with int8 ("numpy") or float16 ("numpy-f16") vectors.
+# Either way: one store per process with a few open collections (see store.py).
+VECTOR_BACKEND = os.environ.get("SAHARA_VECTOR_BACKEND", "chroma")
+MAX_OPEN_COLLECTIONS = 4
+if VECTOR_BACKEND not in ("chroma", "numpy", "numpy-f16"):
+    raise ValueError(f"Unknown SAHARA_VECTOR_BACKEND: {VECTOR_BACKEND}")
+
+_opened = {}
+_open_lock = threading.Lock()
+
+def _open_once(name, opener):
+    handle = _opened.get(name)
+    if handle is None:
+        with _open_lock:
+            handle = _opened.get(name)
+            if handle is None:
+                os.makedirs(CHROMA_PATH, exist_ok=True)
+                handle = _opened[name] = opener()
+    return handle
+
+def get_store():
+    if VECTOR_BACKEND == "chroma":
+        return _open_once("store", lambda: StoreManager(CHROMA_PATH, max_open=MAX_OPEN_COLLECTIONS))
+    return _open_once("store", lambda: NumpyStore(CHROMA_PATH, max_open=MAX_OPEN_COLLECTIONS,
+                                                  dtype='float16' if VECTOR_BACKEND == "numpy-f16" else 'int8'))
+
+# Embeddings are cached on disk (shared by ingestion and retrieval) with an LRU for queries
+def get_embedding_cache():
+    return _open_once("embeddings", lambda: EmbeddingCache(
+        EMBED_MODEL_NAME, os.path.join(CHROMA_PATH, "embedding_cache.sqlite3")))
+
+def _encode(texts):
+    start = perf_counter()
+    vectors = get_embedder().encode(texts, batch_size=max(len(texts), 1), show_progress_bar=False)
+    telemetry.stage("embedder.encode", start, texts=len(texts))
+    return vectors
+
+def embed_texts(texts):
+    """Embeds texts through the cache; only unseen texts reach the model."""
+    return get_embedding_cache().encode(texts, _encode)
+
+def embed_query(text):
+    return get_embedding_cache().encode_query(text, _encode)
+
+# BM25 inverted index over the same documents, for hybrid retrieval (see lexical.py)
+def get_lexical_index():
+    return _open_once("lexical", lambda: LexicalIndex(os.path.join(CHROMA_PATH, "lexical.sqlite3")))
+
+# Ingestion: messages per embedding batch, and embedding threads running ahead of writes
+INGEST_BATCH_SIZE = 256
+INGEST_WORKERS = 2
+
+# ── WhatsApp export parsing ──────────────────────────────────────────────────
+# Exports differ by platform and locale, e.g.
+#   iOS:     [15/08/2023, 9:05:12 PM] Aai: message
+#   Android: 15/08/23, 21:05 - Aai: message
+# The layout and day/month order are sniffed once per file; every line after
+# that is matched by a single precompiled pattern and converted with int() —
+# no per-line strptime attempts.
+_TIMESTAMP = (
+    r'(\d{1,2})[/.\-](\d{1,2})[/.\-](\d{2,4}),? '
+    r'(\d{1,2})[:.](\d{2})(?:[:.](\d{2}))?'
+    r'(?:[ \u202f\u00a0]?([AaPp])\.?\s?[Mm]\.?)?'
+)
+# sender is optional: system lines ("Messages are end-to-end encrypted") have none
+_BRACKET_LINE = re.compile(r'\u200e?\[' + _TIMESTAMP + r'\] (?:([^:]+?): )?(.*)')
+_DASH_LINE = re.compile(r'\u200e?' + _TIMESTAMP + r' - (?:([^:]+?): )?(.*)')
+_SNIFF_LINES = 200
+
+
+class ChatMessage(NamedTuple):
+    """One parsed message. Supports msg['message'] style access for older callers."""
+    date: datetime
+    sender: str
+    message: str
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+
+def sniff_export_format(lines):
     """
-    Parses a WhatsApp chat export file and normalizes the data into a list of dictionaries.
-    Each dict contains: 'date' (datetime), 'sender' (str), 'message' (str)
-    Supports common formats like [dd/mm/yyyy, h:mm:ss AM/PM] Sender: message
+    Detects the export layout from a sample of lines.
+    Returns (pattern, day_first) or None when no line looks like a message header.
+    Day/month order is decided by any field > 12; ambiguous exports default to
+    day-first (Indian locale).
     """
-    messages = []
-    # Updated pattern for [dd/mm/yyyy, h:mm:ss AM/PM] Sender: message (non-capturing for AM/PM)
-    date_pattern = r'\[(\d{1,2}/\d{1,2}/\d{4}), (\d{1,2}:\d{2}:\d{2} (?:AM|PM))\] (.*?): (.*)'
-    # Fallback for other formats: (mm/dd/yy, h:mm AM/PM) - Sender: message
-    fallback_pattern = r'(\d{1,2}/\d{1,2}/\d{2}), (\d{1,2}:\d{2}) (?:AM|PM) - (.*?): (.*)'
+    best, best_hits = None, 0
+    for pattern in (_BRACKET_LINE, _DASH_LINE):
+        hits = [m for m in map(pattern.match, lines) if m]
+        if len(hits) > best_hits:
+            best, best_hits = (pattern, hits), len(hits)
+    if best is None:
+        return None
+
+    pattern, hits = best
+    day_first = True
+    for m in hits:
+        if int(m.group(1)) > 12:
+            break
+        if int(m.group(2)) > 12:
+            day_first = False
+            break
+    return pattern, day_first
+
+
+def _build_date(groups, day_first):
+    a, b, year, hour, minute, second, meridiem = groups
+    day, month = (int(a), int(b)) if day_first else (int(b), int(a))
+    year = int(year)
+    if year < 100:
+        year += 2000
+    hour = int(hour)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem in 'Pp' else 0)
+    return datetime(year, month, day, hour, int(minute), int(second) if second else 0)
 
+
+def iter_whatsapp_messages(file_path):
+    """
+    Streams a WhatsApp chat export, yielding ChatMessage records one at a time.
+    Multi-line messages are joined with spaces; system notices are skipped.
+    Memory use is independent of the export size.
+    """
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
 
-    with open(file_path, 'r', encoding='utf-8') as f:
-        current_message = None
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        head = []
         for line in f:
+            line = line.strip()
+            if line:
+                head.append(line)
+                if len(head) >= _SNIFF_LINES:
+                    break
+
+        sniffed = sniff_export_format(head)
+        if sniffed is None:
+            return
+        match, day_first = sniffed[0].match, sniffed[1]
+
+        date = sender = None
+        parts = []
+        for line in chain(head, f):
             line = line.strip()
             if not line:
                 continue
-
-            # Try primary pattern
-            match = re.match(date_pattern, line)
-            if not match:
-                # Try fallback
-                match = re.match(fallback_pattern, line)
-
-            if match:
-                if current_message:
-                    # Append to previous if multi-line
-                    current_message['message'] += ' ' + line
-                else:
-                    # New message
-                    groups = match.groups()
-                    if len(groups) == 4:
-                        date_str, time_str, sender, message = groups
-                        full_date_str = f"{date_str} {time_str}"
-                        # Try parse with common formats
-                        date_formats = [
-                            '%d/%m/%Y %I:%M:%S %p',  # dd/mm/yyyy
-                            '%m/%d/%y %I:%M %p',     # mm/dd/yy
-                            '%d/%m/%y %H:%M'         # 24h fallback
-                        ]
-                        date_obj = None
-                        for fmt in date_formats:
-                            try:
-                                date_obj = datetime.strptime(full_date_str, fmt)
-                                break
-                            except ValueError:
-                                continue
-                        if date_obj:
-                            current_message = {
-                                'date': date_obj,
-                                'sender': sender.strip(),
-                                'message': message.strip()
-                            }
-                            messages.append(current_message)
-                    else:
-                        continue
-            elif current_message:
+            m = match(line)
+            if m is None:
                 # Multi-line continuation
-                current_message['message'] += ' ' + line
+                if parts:
+                    parts.append(line)
+                continue
 
-    print(f"Parsed {len(messages)} messages.")
-    return messages
+            if parts:
+                yield ChatMessage(date, sender, ' '.join(parts))
+                parts = []
+            groups = m.groups()
+            if groups[7] is None:
+                continue  # system notice, no sender
+            try:
+                date = _build_date(groups[:7], day_first)
+            except ValueError:
+                continue  # impossible date, e.g. sniffed order was wrong for this line
+            sender = groups[7].strip()
+            parts = [groups[8].strip()]
 
-# Function to create vector store with embeddings
-def create_vector_store(messages, collection_name='sahara_memories'):
+        if parts:
+            yield ChatMessage(date, sender, ' '.join(parts))
+
+
+# Function to parse WhatsApp chat export (_chat.txt)
+def parse_whatsapp_chat(file_path):
     """
-    Generates embeddings for each message chunk and stores them in a local ChromaDB collection.
+    Parses a WhatsApp chat export file into a list of ChatMessage records.
+    Each record has: 'date' (datetime), 'sender' (str), 'message' (str)
+    Prefer iter_whatsapp_messages() for large exports — it streams.
     """
-    client = chromadb.PersistentClient(path="./chroma_db")  # Local persistent storage
+    messages = list(iter_whatsapp_messages(file_path))
+    print(f"Parsed {len(messages)} messages.")
+    return messages
 
-    # Check if collection exists, delete if it does (for fresh start in hackathon)
-    try:
-        existing = client.get_collection(collection_name)
-        client.delete_collection(collection_name)
-    except:
-        pass
-
-    collection = client.create_collection(
-        name=collection_name
-    )
-
-    # Prepare data
-    ids = []
-    documents = []
-    metadatas = []
-    for i, msg in enumerate(messages):
+# Stable id for a message: the same message gets the same id on every re-import
+def message_id(msg):
+    key = f"{msg['date'].isoformat()}\x1f{msg['sender']}\x1f{msg['message']}"
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+def _batched(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _single_messages(messages):
+    """One record per message (the pre-windowing layout), skipping very short ones."""
+    for msg in messages:
         chunk = msg['message']
         if chunk and len(chunk) > 10:  # Skip very short/empty
-            ids.append(str(i))
-            documents.append(chunk)
-            metadatas.append({
+            yield message_id(msg), chunk, {
                 'date': msg['date'].isoformat(),
                 'sender': msg['sender']
-            })
+            }
 
+def _record_batches(records, batch_size, seen):
+    """Yields (ids, documents, metadatas) batches of records, skipping duplicates."""
+    ids, documents, metadatas = [], [], []
+    for doc_id, document, metadata in records:
+        if doc_id in seen:
+            continue
+        seen.add(doc_id)
+        ids.append(doc_id)
+        documents.append(document)
+        metadatas.append(metadata)
+        if len(ids) == batch_size:
+            yield ids, documents, metadatas
+            ids, documents, metadatas = [], [], []
     if ids:
-        # Batch embed
-        embeddings = embedder.encode(documents).tolist()
-        collection.add(
+        yield ids, documents, metadatas
+
+def _embed_batch(ids, documents, metadatas):
+    embeddings = embed_texts(documents)
+    return ids, documents, metadatas, embeddings.tolist()
+
+def _print_progress(processed, added):
+    print(f"  ...{processed} chunks processed, {added} embedded")
+
+# Function to create vector store with embeddings
+def create_vector_store(messages, collection_name='sahara_memories', prune=True,
+                        batch_size=INGEST_BATCH_SIZE, workers=INGEST_WORKERS, progress=None,
+                        windows=True):
+    """
+    Incrementally syncs messages into a local vector collection (see VECTOR_BACKEND).
+    Ids are content hashes, so re-importing an updated export only embeds messages
+    not already stored. With prune=True, stored messages missing from this export
+    (deleted or edited upstream) are removed.
+
+    With windows=True (default) consecutive messages are grouped into conversation
+    windows (chunking.py) and each window is embedded once; windows=False stores one
+    vector per message.
+
+    messages may be any iterable (e.g. iter_whatsapp_messages()). It is consumed in
+    batches of batch_size chunks; `workers` threads embed while this thread writes finished
+    batches to the store, with at most workers + 1 batches in flight, so peak memory does
+    not grow with the export. progress(processed, added) is called after each write.
+    """
+    start = perf_counter()
+    index = get_store().get_index(collection_name, create=True)  # Local persistent storage
+    lexical_index = get_lexical_index()
+    batch_size = min(batch_size, index.max_batch_size)
+
+    seen = set()
+    pending = deque()
+    processed = added = 0
+
+    def write_oldest():
+        nonlocal processed, added
+        future, batch_len = pending.popleft()
+        ids, documents, metadatas, embeddings = future.result()
+        index.upsert(
             ids=ids,
             embeddings=embeddings,
             metadatas=metadatas,
             documents=documents
         )
-        print(f"Added {len(ids)} embeddings to collection '{collection_name}'.")
-    else:
-        print("No messages to embed.")
+        processed += batch_len
+        added += len(ids)
+        if progress:
+            progress(processed, added)
+
+    vanished = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            records = conversation_windows(messages) if windows else _single_messages(messages)
+            for ids, documents, metadatas in _record_batches(records, batch_size, seen):
+                # Lexical postings are cheap: index them right away (also backfills
+                # stores built before the lexical index existed). Sender names are left
+                # out: they are in most windows and would only add noise to BM25
+                lex_missing = set(lexical_index.missing(collection_name, ids))
+                if lex_missing:
+                    lexical_index.add(collection_name,
+                                      [d for d in ids if d in lex_missing],
+                                      [message_text(doc, meta) for d, doc, meta in zip(ids, documents, metadatas)
+                                       if d in lex_missing])
 
-    return collection
+                # Diff against what is already stored; embed only what is new
+                stored = index.existing(ids)
+                keep = [i for i, doc_id in enumerate(ids) if doc_id not in stored]
+                if not keep:
+                    processed += len(ids)
+                    continue
+                pending.append((pool.submit(
+                    telemetry.bind(_embed_batch),
+                    [ids[i] for i in keep],
+                    [documents[i] for i in keep],
+                    [metadatas[i] for i in keep]
+                ), len(keep)))
+                processed += len(ids) - len(keep)
+                # Backpressure: don't parse further ahead than the embedders
+                while len(pending) > workers:
+                    write_oldest()
+            while pending:
+                write_oldest()
+
+        if prune:
+            vanished = [doc_id for doc_id in index.iter_ids(batch_size) if doc_id not in seen]
+            for batch in _batched(vanished, batch_size):
+                index.delete(ids=batch)
+            # The lexical index is pruned by its own ids: it can hold documents whose
+            # vectors never landed (e.g. an interrupted import of another export)
+            stale = [doc_id for doc_id in lexical_index.ids(collection_name) if doc_id not in seen]
+            for batch in _batched(stale, batch_size):
+                lexical_index.delete(collection_name, batch)
+    finally:
+        # Persist, and make cached handles elsewhere see the new data
+        index.commit()
+
+    print(f"Collection '{collection_name}': {added} added, {len(vanished)} removed, "
+          f"{len(seen) - added} unchanged.")
+    telemetry.stage("rag.ingest", start, chunks=len(seen), added=added, removed=len(vanished))
+
+    return index
+
+# ── Resumable import ─────────────────────────────────────────────────────────
+# While an import runs, a small checkpoint file next to the store records the
+# source export. It is removed when the import finishes, so one left behind
+# means the import was interrupted; resume_import() re-runs it, and because
+# ids are content hashes only the batches that never reached the store are embedded.
+def _checkpoint_path(collection_name):
+    return os.path.join(CHROMA_PATH, f"{collection_name}.import.json")
+
+def import_chat(file_path, collection_name='sahara_memories', progress=_print_progress, **kwargs):
+    """
+    Streams a WhatsApp export straight into the vector store with a resume checkpoint.
+    Extra kwargs are passed to create_vector_store().
+    """
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    checkpoint = _checkpoint_path(collection_name)
+    state = {'source': os.path.abspath(file_path), 'started': datetime.now().isoformat(),
+             'processed': 0, 'added': 0}
+
+    def record(processed, added):
+        state.update(processed=processed, added=added)
+        tmp = checkpoint + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp, checkpoint)
+        if progress:
+            progress(processed, added)
+
+    record(0, 0)
+    index = create_vector_store(iter_whatsapp_messages(file_path), collection_name,
+                                progress=record, **kwargs)
+    os.remove(checkpoint)
+    return index
+
+def interrupted_import(collection_name='sahara_memories'):
+    """Returns the checkpoint of an unfinished import, or None."""
+    try:
+        with open(_checkpoint_path(collection_name), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def resume_import(collection_name='sahara_memories', **kwargs):
+    """Finishes an interrupted import_chat(). Returns the index, or None if nothing to resume."""
+    state = interrupted_import(collection_name)
+    if state is None:
+        return None
+    print(f"Resuming import of {state['source']} ({state['processed']} messages already processed)")
+    return import_chat(state['source'], collection_name, **kwargs)
+
+# ── Hybrid retrieval ─────────────────────────────────────────────────────────
+# Stage 1: BM25 over transliteration-folded tokens (sqlite lookups, no model).
+# If its hits are conclusive, those are returned and the query is never embedded:
+# at least 2 informative query terms, the top_k hits all contain every one of
+# them, and the first hit left out trails the top_k-th by more than LEXICAL_MARGIN
+# of the top score. The margin is what keeps this from firing more often as the
+# corpus grows: with more documents matching every term, the scores around the
+# cut-off bunch together and the dense stage decides. Otherwise stage 2 runs the
+# dense search and the two candidate lists are fused:
+# DENSE_WEIGHT * cosine + (1 - DENSE_WEIGHT) * BM25 / max BM25.
+CANDIDATE_FACTOR = 3
+DENSE_WEIGHT = 0.6
+LEXICAL_MARGIN = 0.25
+
+def _lexical_confident(terms, hits, top_k):
+    if len(terms) < 2 or len(hits) < top_k or any(hit[2] < len(terms) for hit in hits[:top_k]):
+        return False
+    cutoff = hits[top_k][1] if len(hits) > top_k else 0.0
+    return hits[top_k - 1][1] - cutoff > LEXICAL_MARGIN * hits[0][1]
 
 # Function for retrieval
-def retrieve_memories(query, collection_name='sahara_memories', top_k=5):
+def retrieve_memories(query, collection_name='sahara_memories', top_k=5, timings=None,
+                      with_embedding=False):
     """
-    Embeds the query and performs cosine similarity search in ChromaDB to retrieve top_k relevant memories.
-    Returns list of dicts: {'document': str, 'metadata': dict, 'distance': float}
+    Retrieves the top_k memories most relevant to the query (lexical + dense, see above).
+    Returns list of dicts: {'id': str, 'document': str, 'metadata': dict,
+    'distance': float or None (None when the dense stage was skipped), 'score': float}
+    If a timings dict is passed it is filled with per-stage milliseconds.
+    With with_embedding=True returns (memories, query embedding), the embedding
+    being None when the dense stage was skipped and the query never embedded.
     """
-    client = chromadb.PersistentClient(path="./chroma_db")
-    collection = client.get_collection(name=collection_name)
-
-    # Embed query
-    query_embedding = embedder.encode([query]).tolist()[0]
-
-    # Query
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k,
-        include=['documents', 'metadatas', 'distances']
-    )
-
-    retrieved = []
-    for i in range(len(results['ids'][0])):
-        retrieved.append({
-            'document': results['documents'][0][i],
-            'metadata': results['metadatas'][0][i],
-            'distance': results['distances'][0][i]
-        })
+    start = perf_counter()
+    index = get_store().get_index(collection_name)  # cached handle, see store.py / vector_index.py
+    stage = {'embed_ms': 0.0, 'dense_ms': 0.0}
+    query_embedding = None
+
+    # Stage 1: lexical
+    terms, hits = get_lexical_index().search(collection_name, query, top_k * CANDIDATE_FACTOR)
+    t_lexical = perf_counter()
+    stage['lexical_ms'] = (t_lexical - start) * 1000
+    lex_max = hits[0][1] if hits else 1.0
 
+    if _lexical_confident(terms, hits, top_k):
+        retrieved = index.get([doc_id for doc_id, _, _ in hits[:top_k]])
+        scores = {doc_id: score / lex_max for doc_id, score, _ in hits[:top_k]}
+        for mem in retrieved:
+            mem['distance'] = None
+            mem['score'] = scores[mem['id']]
+        stage['dense_skipped'] = True
+    else:
+        # Stage 2: dense
+        query_embedding = embed_query(query)
+        t_embed = perf_counter()
+        dense = index.query(query_embedding.tolist(), top_k * CANDIDATE_FACTOR)
+        t_dense = perf_counter()
+        stage['embed_ms'] = (t_embed - t_lexical) * 1000
+        stage['dense_ms'] = (t_dense - t_embed) * 1000
+
+        # Fuse
+        fused = {doc_id: (1 - DENSE_WEIGHT) * score / lex_max for doc_id, score, _ in hits}
+        by_id = {mem['id']: mem for mem in dense}
+        for mem in dense:
+            fused[mem['id']] = fused.get(mem['id'], 0.0) + DENSE_WEIGHT * (1 - mem['distance'] / 2)
+        best = sorted(fused, key=lambda doc_id: -fused[doc_id])[:top_k]
+        lexical_only = {mem['id']: mem for mem in index.get([d for d in best if d not in by_id])}
+        retrieved = []
+        for doc_id in best:
+            mem = by_id.get(doc_id) or lexical_only.get(doc_id)
+            if mem is None:
+                continue  # indexed lexically but its vector never landed (interrupted import)
+            mem.setdefault('distance', None)
+            mem['score'] = fused[doc_id]
+            retrieved.append(mem)
+        stage['dense_skipped'] = False
+
+    end = perf_counter()
+    stage['total_ms'] = (end - start) * 1000
+    retrieval = telemetry.stage("rag.retrieve", start, end, results=len(retrieved),
+                                dense_skipped=stage['dense_skipped'])
+    telemetry.stage("rag.lexical", start, t_lexical, parent=retrieval)
+    if not stage['dense_skipped']:
+        telemetry.stage("rag.embed_query", t_lexical, t_embed, parent=retrieval)
+        telemetry.stage("rag.dense", t_embed, t_dense, parent=retrieval)
+    if timings is not None:
+        timings.update({k: round(v, 3) if isinstance(v, float) else v for k, v in stage.items()})
+    if with_embedding:
+        return retrieved, query_embedding
     return retrieved
+
 def generate_response(user_message):
     memories = retrieve_memories(user_message)
 
@@ -160,8 +504,9 @@ def generate_response(user_message):
 
     formatted = []
     for mem in memories:
+        # Show the exact matching line of the conversation window
         formatted.append(
-            f"[{mem['metadata']['date'][:10]}] {mem['metadata']['sender']}: {mem['document']}"
+            f"[{mem['metadata']['date'][:10]}] {best_line(mem, user_message)}"
         )
 
     context = "\n\n".join(formatted)
@@ -187,4 +532,4 @@ if __name__ == "__main__":
     memories = retrieve_memories(query)
     print("\nRetrieved Memories (based on sample chat):")
     for mem in memories:
-        print(f"Distance: {mem['distance']:.4f} | Sender: {mem['metadata']['sender']} | Date: {mem['metadata']['date'][:10]} | Message: {mem['document']}")
\ No newline at end of file
+        print(f"Score: {mem['score']:.4f} | Sender: {mem['metadata']['sender']} | Date: {mem['metadata']['date'][:10]} | Message: {mem['document']}")
\ No newline at end of file
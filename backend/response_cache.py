@@ -0,0 +1,148 @@
+"""
+Sahara semantic response cache
+==============================
+Users send near-identical messages many times a day ("Missing Aai today",
+"missing aai today 💙"), and each one costs ~200 tokens of CPU generation.
+This cache returns the earlier answer when both hold:
+
+  - the query embedding is within `threshold` cosine similarity of a cached
+    query, and
+  - retrieval returned exactly the same set of memory ids, so the answer was
+    grounded in the same memories (a new import invalidates it naturally)
+
+Entries expire after ttl_s and the least recently used are evicted beyond
+max_entries. They are persisted in sqlite next to the other caches and held
+in memory per memory-id set, so a lookup is one small matrix product.
+
+Callers must not cache crisis inputs (safety.is_crisis); llm_server skips
+both lookup and store for them, and for queries retrieval answered from the
+lexical stage alone (it reuses retrieval's query embedding, never adds one).
+
+stats() reports lookups, hits, hit rate and the generation time saved
+(sum of the original generation times of the answers served from cache).
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def memory_key(memory_ids):
+    """Order-independent key for a set of retrieved memory ids."""
+    digest = hashlib.blake2b(digest_size=16)
+    for memory_id in sorted(set(memory_ids)):
+        digest.update(memory_id.encode('utf-8') + b"\x1f")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path, threshold=0.92, ttl_s=7 * 24 * 3600, max_entries=2000):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+
+        # entry id -> (memory key, unit vector, response, created, cost_ms), LRU order
+        self._entries = OrderedDict()
+        self._by_memories = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                id        INTEGER PRIMARY KEY,
+                memories  TEXT NOT NULL,
+                vector    BLOB NOT NULL,
+                response  TEXT NOT NULL,
+                created   REAL NOT NULL,
+                last_used REAL NOT NULL,
+                cost_ms   REAL NOT NULL
+            )""")
+        self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl_s,))
+        self._db.commit()
+        for row in self._db.execute("SELECT id, memories, vector, response, created, cost_ms "
+                                    "FROM responses ORDER BY last_used"):
+            self._add(row[0], row[1], np.frombuffer(row[2], dtype=np.float32), row[3], row[4], row[5])
+
+        self.lookups = 0
+        self.hits = 0
+        self.saved_ms = 0.0
+
+    def _add(self, entry_id, key, vector, response, created, cost_ms):
+        self._entries[entry_id] = (key, vector, response, created, cost_ms)
+        self._by_memories.setdefault(key, []).append(entry_id)
+
+    def _remove(self, entry_id):
+        key = self._entries.pop(entry_id)[0]
+        ids = self._by_memories[key]
+        ids.remove(entry_id)
+        if not ids:
+            del self._by_memories[key]
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, query_vector, memory_ids):
+        """The cached response for a similar query over the same memories, or None."""
+        key = memory_key(memory_ids)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            ids = [i for i in self._by_memories.get(key, ()) if now - self._entries[i][3] <= self.ttl_s]
+            if not ids:
+                return None
+            sims = np.stack([self._entries[i][1] for i in ids]) @ self._unit(query_vector)
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            entry_id = ids[best]
+            self._entries.move_to_end(entry_id)
+            _, _, response, _, cost_ms = self._entries[entry_id]
+            self.hits += 1
+            self.saved_ms += cost_ms
+            self._db.execute("UPDATE responses SET last_used = ? WHERE id = ?", (now, entry_id))
+            self._db.commit()
+            return response
+
+    def store(self, query_vector, memory_ids, response, cost_ms):
+        """Caches `response`, which took cost_ms to generate."""
+        key = memory_key(memory_ids)
+        vector = self._unit(query_vector)
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO responses (memories, vector, response, created, last_used, cost_ms) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (key, vector.tobytes(), response, now, now, cost_ms))
+            self._add(cursor.lastrowid, key, vector, response, now, cost_ms)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                entry_id = next(iter(self._entries))
+                self._remove(entry_id)
+                evicted.append((entry_id,))
+            expired = [entry_id for entry_id, entry in self._entries.items() if now - entry[3] > self.ttl_s]
+            for entry_id in expired:
+                self._remove(entry_id)
+                evicted.append((entry_id,))
+            self._db.executemany("DELETE FROM responses WHERE id = ?", evicted)
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_memories.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "latency_saved_ms": round(self.saved_ms, 1),
+            }
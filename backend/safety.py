@@ -0,0 +1,25 @@
+"""
+Sahara safety checks
+====================
+Crisis keywords (EN + HI + MR) and the fixed crisis response, shared by
+voice.py (transcripts) and llm_server.py (crisis inputs bypass the response
+cache, so they always get a fresh, safety-first answer).
+"""
+
+# ── Crisis keywords (EN + HI + MR) ────────────────────────────────────────────
+CRISIS_WORDS = [
+    "suicide", "kill myself", "end my life", "want to die",
+    "jeena nahi", "marna chahta", "jiv dyaycha", "sampvaycha", "nako aata"
+]
+
+CRISIS_RESPONSE = {
+    "response": "💙 Tum akele nahi ho. Please abhi inhe call karo:\n\n"
+                "• iCall: 9152987821\n"
+                "• Vandrevala: 1860-2662-345 (24/7)\n"
+                "• SNEHI: 044-24640050\n\n"
+                "Sahara tumhare saath hai. 🙏",
+    "crisis": True
+}
+
+def is_crisis(text: str) -> bool:
+    return any(kw in text.lower() for kw in CRISIS_WORDS)
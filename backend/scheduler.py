@@ -0,0 +1,245 @@
+"""
+Sahara inference scheduler
+==========================
+A llama.cpp model instance is not safe to call from several threads, and
+Flask's threaded server would otherwise let any number of /generate calls
+pile up on it. All generation goes through an InferenceScheduler instead:
+
+  - one worker thread per model instance (a pool of N for machines with the
+    cores and RAM for it), each owning its instance exclusively
+  - a priority queue in front of them (lower number runs first, FIFO within
+    a priority) with a maximum depth: submit() raises QueueFull immediately
+    when it is full, so the server can answer 429 instead of stalling
+  - a deadline per job: jobs whose deadline passed (or whose client went
+    away) are dropped before they reach a model and no longer count against
+    the depth, and a running job stops at the next token once it expires or
+    is cancelled
+
+Jobs are generator functions fn(instance) that yield pieces of output; the
+worker forwards pieces to the waiting request thread as they are produced,
+so the same path serves streaming and blocking responses.
+
+  job = scheduler.submit(lambda inst: stream_tokens(inst, ...), priority=1, deadline_s=60)
+  for piece in job.results(): ...      # raises DeadlineExceeded / JobCancelled / the job's error
+  job.timings()                        # queue_wait_ms vs generation_ms
+"""
+import heapq
+import itertools
+import queue
+import threading
+from time import perf_counter
+
+import telemetry
+
+
+class QueueFull(Exception):
+    """The queue is at max depth; retry later (HTTP 429)."""
+
+
+class DeadlineExceeded(Exception):
+    """The job's deadline passed before it finished."""
+
+
+class JobCancelled(Exception):
+    """The job was cancelled (its client went away) before it finished."""
+
+
+class SchedulerClosed(Exception):
+    """The scheduler is shutting down and takes no new work."""
+
+
+class Job:
+    def __init__(self, fn, priority, deadline_s):
+        self.fn = fn
+        self.priority = priority
+        self.submitted = perf_counter()
+        self.deadline = self.submitted + deadline_s
+        self.started = None
+        self.finished = None
+        self.instance = None
+        self.cancelled = False
+        self._out = queue.Queue()
+
+    def expired(self):
+        return perf_counter() > self.deadline
+
+    def cancel(self):
+        """Nobody is waiting any more: drop it if queued, stop it if running."""
+        self.cancelled = True
+
+    def results(self):
+        """
+        Yields the job's output pieces as the worker produces them. Raises
+        DeadlineExceeded if the deadline passes before the last piece (even
+        with pieces already yielded), JobCancelled if the job was cancelled
+        by someone else, or whatever the job raised. Closing the generator
+        early cancels the job.
+        """
+        try:
+            while True:
+                try:
+                    kind, value = self._out.get(timeout=max(self.deadline - perf_counter(), 0))
+                except queue.Empty:
+                    raise DeadlineExceeded("timed out waiting for the model") from None
+                if kind == "piece":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            self.cancel()
+
+    def timings(self):
+        wait_end = self.started if self.started is not None else (self.finished or perf_counter())
+        timings = {"queue_wait_ms": round((wait_end - self.submitted) * 1000, 1)}
+        if self.started is not None:
+            timings["generation_ms"] = round(((self.finished or perf_counter()) - self.started) * 1000, 1)
+            timings["instance"] = self.instance
+        return timings
+
+
+class InferenceScheduler:
+    def __init__(self, load_instance, instances=1, max_queue=8):
+        """
+        load_instance(slot) returns what a job function receives (e.g. the
+        model plus its per-instance caches); it runs on the slot's worker
+        thread on its first job.
+        """
+        self.load_instance = load_instance
+        self.instances = instances
+        self.max_queue = max_queue
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._running = 0
+        self._closed = False
+        self._counts = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0,
+                        "expired": 0, "cancelled": 0}
+        self._wait_ms = self._gen_ms = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._workers or self._closed:
+                return
+            for slot in range(self.instances):
+                worker = threading.Thread(target=self._work, args=(slot,), daemon=True,
+                                          name=f"inference-{slot}")
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, fn, priority=1, deadline_s=60.0):
+        self.start()
+        job = Job(fn, priority, deadline_s)
+        with self._cond:
+            if self._closed:
+                raise SchedulerClosed("scheduler is shutting down")
+            if len(self._heap) >= self.max_queue:
+                self._drop_dead()
+            if len(self._heap) >= self.max_queue:
+                self._counts["rejected"] += 1
+                raise QueueFull(f"{len(self._heap)} requests already queued")
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            self._counts["submitted"] += 1
+            self._cond.notify()
+        return job
+
+    def close(self, timeout=None):
+        """Stops taking work, fails whatever is still queued and waits for running jobs."""
+        with self._cond:
+            self._closed = True
+            pending, self._heap = self._heap, []
+            self._cond.notify_all()
+        for _, _, job in pending:
+            job._out.put(("error", SchedulerClosed("scheduler is shutting down")))
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            self._drop_dead()
+            stats = dict(self._counts, queued=len(self._heap), running=self._running,
+                         instances=self.instances, max_queue=self.max_queue)
+            done = self._counts["completed"] + self._counts["failed"]
+            stats["mean_queue_wait_ms"] = round(self._wait_ms / done, 1) if done else 0.0
+            stats["mean_generation_ms"] = round(self._gen_ms / done, 1) if done else 0.0
+        return stats
+
+    # ── Worker ───────────────────────────────────────────────────────────────
+    def _next_job(self):
+        with self._cond:
+            while not self._heap and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return None
+            job = heapq.heappop(self._heap)[2]
+            if job.cancelled or job.expired():
+                self._drop(job)
+                return False
+            self._running += 1
+            return job
+
+    # Callers hold self._cond for both
+    def _drop(self, job):
+        if job.cancelled:
+            self._counts["cancelled"] += 1
+            job._out.put(("error", JobCancelled("dropped: cancelled while queued")))
+        else:
+            self._counts["expired"] += 1
+            job._out.put(("error", DeadlineExceeded("dropped: deadline passed while queued")))
+
+    def _drop_dead(self):
+        """Removes queued jobs nobody will wait for, so they stop counting against max_queue."""
+        live = []
+        for entry in self._heap:
+            if entry[2].cancelled or entry[2].expired():
+                self._drop(entry[2])
+            else:
+                live.append(entry)
+        if len(live) < len(self._heap):
+            heapq.heapify(live)
+            self._heap = live
+
+    def _work(self, slot):
+        instance = None
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            if job is False:
+                continue
+            job.started = perf_counter()
+            job.instance = slot
+            telemetry.QUEUE_WAIT_SECONDS.observe(job.started - job.submitted)
+            outcome = "completed"
+            pieces = None
+            try:
+                if instance is None:
+                    instance = self.load_instance(slot)
+                pieces = job.fn(instance)
+                for piece in pieces:
+                    if job.cancelled or job.expired():
+                        outcome = "expired" if job.expired() else "cancelled"
+                        break
+                    job._out.put(("piece", piece))
+                # A stopped job must not look finished: its output is truncated
+                if outcome == "expired":
+                    job._out.put(("error", DeadlineExceeded("deadline passed while generating")))
+                elif outcome == "cancelled":
+                    job._out.put(("error", JobCancelled("cancelled while generating")))
+                else:
+                    job._out.put(("done", None))
+            except Exception as e:
+                outcome = "failed"
+                job._out.put(("error", e))
+            finally:
+                if pieces is not None:
+                    pieces.close()
+                job.finished = perf_counter()
+                with self._cond:
+                    self._running -= 1
+                    self._counts[outcome] += 1
+                    if outcome in ("completed", "failed"):
+                        self._wait_ms += (job.started - job.submitted) * 1000
+                        self._gen_ms += (job.finished - job.started) * 1000
@@ -0,0 +1,160 @@
+"""
+Sahara vector store manager
+===========================
+One process-wide Chroma client plus an LRU of open collection handles, so
+/chat and /generate don't reopen sqlite and reload the HNSW segment on every
+request.
+
+  store = StoreManager("./chroma_db", max_open=4)
+  collection = store.get_collection("sahara_memories")
+
+Staleness: every import bumps a small version file next to the store
+(<name>.version). A cached handle is re-fetched when that file's mtime changes,
+so an import from another process (or a deleted and recreated collection) is
+noticed on the next request. Per-user collections share the client; at most
+max_open handles are kept, least recently used first out.
+
+get_index() wraps a collection in ChromaIndex, the interface rag.py codes
+against (vector_index.NumpyStore provides the same one without Chroma).
+"""
+import os
+import threading
+from collections import OrderedDict
+
+
+class StoreManager:
+    def __init__(self, path, max_open=4):
+        self.path = path
+        self.max_open = max_open
+        self._client = None
+        self._handles = OrderedDict()   # name -> (collection, version)
+        self._lock = threading.RLock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import chromadb  # deferred: importing chromadb alone costs ~1s
+                    self._client = chromadb.PersistentClient(path=self.path)
+        return self._client
+
+    def _version_path(self, name):
+        return os.path.join(self.path, f"{name}.version")
+
+    def _version(self, name):
+        try:
+            return os.stat(self._version_path(name)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def get_collection(self, name, create=False):
+        """Returns a cached handle, re-fetching it if an import changed the collection."""
+        version = self._version(name)
+        with self._lock:
+            cached = self._handles.get(name)
+            if cached is not None and cached[1] == version:
+                self._handles.move_to_end(name)
+                return cached[0]
+
+            if create:
+                collection = self.client.get_or_create_collection(name=name)
+            else:
+                collection = self.client.get_collection(name=name)
+            self._handles[name] = (collection, version)
+            self._handles.move_to_end(name)
+            while len(self._handles) > self.max_open:
+                self._handles.popitem(last=False)
+            return collection
+
+    def mark_changed(self, name):
+        """Called after writing to a collection; other handles (and processes) re-fetch."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._version_path(name), 'w', encoding='utf-8') as f:
+            f.write(str(os.getpid()))
+        with self._lock:
+            self._handles.pop(name, None)
+
+    def forget(self, name):
+        """Drops a cached handle, e.g. after Chroma reported it missing."""
+        with self._lock:
+            self._handles.pop(name, None)
+
+    def delete_collection(self, name):
+        with self._lock:
+            self.client.delete_collection(name)
+            self.mark_changed(name)
+
+    def open_collections(self):
+        with self._lock:
+            return list(self._handles)
+
+    def get_index(self, name, create=False):
+        return ChromaIndex(self, name, self.get_collection(name, create=create))
+
+
+class ChromaIndex:
+    """Vector index interface over one Chroma collection."""
+
+    def __init__(self, store, name, collection):
+        self.store = store
+        self.name = name
+        self.collection = collection
+        self.max_batch_size = store.client.get_max_batch_size()
+
+    def existing(self, ids):
+        return set(self.collection.get(ids=ids, include=[])['ids'])
+
+    def get(self, ids):
+        """Documents for ids, in the given order; unknown ids are skipped."""
+        if not ids:
+            return []
+        results = self.collection.get(ids=ids, include=['documents', 'metadatas'])
+        by_id = {doc_id: {'id': doc_id, 'document': doc, 'metadata': meta}
+                 for doc_id, doc, meta in zip(results['ids'], results['documents'], results['metadatas'])}
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(ids=ids, embeddings=embeddings,
+                               documents=documents, metadatas=metadatas)
+
+    def iter_ids(self, page_size):
+        offset = 0
+        while True:
+            page = self.collection.get(include=[], limit=page_size, offset=offset)['ids']
+            if not page:
+                return
+            yield from page
+            offset += len(page)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def count(self):
+        return self.collection.count()
+
+    def query(self, embedding, top_k):
+        """Returns [{'id', 'document', 'metadata', 'distance'}], nearest first."""
+        from chromadb import errors as chroma_errors
+
+        # Re-fetch once if the collection was replaced underneath us
+        try:
+            results = self.collection.query(
+                query_embeddings=[embedding], n_results=top_k,
+                include=['documents', 'metadatas', 'distances'])
+        except chroma_errors.NotFoundError:
+            self.store.forget(self.name)
+            self.collection = self.store.get_collection(self.name)
+            results = self.collection.query(
+                query_embeddings=[embedding], n_results=top_k,
+                include=['documents', 'metadatas', 'distances'])
+
+        return [{
+            'id': results['ids'][0][i],
+            'document': results['documents'][0][i],
+            'metadata': results['metadatas'][0][i],
+            'distance': results['distances'][0][i]
+        } for i in range(len(results['ids'][0]))]
+
+    def commit(self):
+        self.store.mark_changed(self.name)
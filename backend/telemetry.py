@@ -0,0 +1,302 @@
+"""
+Sahara telemetry
+================
+Per-stage latency for the whole pipeline, so "Sahara feels slow" can be
+traced to embedding, the vector query, LLM prefill or decode, Vosk or the
+distress features:
+
+  SAHARA_TELEMETRY=1 python gateway.py
+  curl http://127.0.0.1:5005/metrics                   # Prometheus text format
+
+With SAHARA_TELEMETRY=1:
+  - every stage lands in the sahara_stage_duration_seconds histogram
+    (label `stage`, e.g. rag.dense, llm.prefill, voice.stt), plus token
+    counts, tokens/s, time to first token and scheduler queue wait
+  - if the opentelemetry SDK is installed, each stage is also a span:
+    requests are root spans, voice → chat carries a W3C traceparent header,
+    and spans and histograms are exported over OTLP when
+    OTEL_EXPORTER_OTLP_ENDPOINT is set
+
+Off (the default) every hook returns after one flag check and traced()
+leaves functions undecorated. /metrics then only reports model load times.
+
+Stages already timed with perf_counter() are recorded after the fact with
+stage(name, start, end), so instrumenting them adds no nesting to the code.
+Only stage names and numbers are recorded: never message text, transcripts
+or memories, in attributes or in error statuses (the exception type only).
+"""
+import functools
+import os
+import threading
+import time
+from time import perf_counter
+
+from models import registry
+
+ENABLED = os.environ.get("SAHARA_TELEMETRY") == "1"
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "sahara")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 100, 200)
+
+# perf_counter() seconds → epoch nanoseconds, for spans recorded after the fact
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+
+def _setup_otel():
+    """(tracer, meter or None, propagate module), or None without the SDK."""
+    try:
+        from opentelemetry import metrics, propagate, trace
+        from opentelemetry.sdk.metrics import MeterProvider
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+    except ImportError:
+        print("Telemetry: opentelemetry not installed, serving /metrics only")
+        return None
+
+    resource = Resource.create({"service.name": SERVICE_NAME})
+    tracer_provider = TracerProvider(resource=resource)
+    meter = None
+    if os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        tracer_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        metrics.set_meter_provider(MeterProvider(resource=resource,
+                                                 metric_readers=[PeriodicExportingMetricReader(OTLPMetricExporter())]))
+        meter = metrics.get_meter("sahara")
+    trace.set_tracer_provider(tracer_provider)
+    return trace.get_tracer("sahara"), meter, propagate
+
+
+_otel = _setup_otel() if ENABLED else None
+_tracer, _meter, _propagate = _otel if _otel else (None, None, None)
+
+
+# ── Metrics ──────────────────────────────────────────────────────────────────
+class Histogram:
+    def __init__(self, name, description, buckets=DURATION_BUCKETS, labels=()):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}        # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        self._otel = _meter.create_histogram(name, description=description) if _meter else None
+
+    def observe(self, value, *label_values):
+        if not ENABLED:
+            return
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+        if self._otel is not None:
+            self._otel.record(value, dict(zip(self.labels, label_values)))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            pairs = [f'{k}="{v}"' for k, v in zip(self.labels, label_values)]
+            for bound, count in zip(self.buckets + ("+Inf",), values[:-2] + [values[-1]]):
+                labels = ",".join(pairs + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{labels}}} {count}")
+            suffix = "{" + ",".join(pairs) + "}" if pairs else ""
+            lines.append(f"{self.name}_sum{suffix} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{suffix} {values[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        self._otel = _meter.create_counter(name, description=description) if _meter else None
+
+    def inc(self, value=1, *label_values):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + value
+        if self._otel is not None:
+            self._otel.add(value, dict(zip(self.labels, label_values)))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            pairs = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            lines.append(f"{self.name}{{{pairs}}} {value}" if pairs else f"{self.name} {value}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("sahara_stage_duration_seconds", "Time spent in each pipeline stage.",
+                          labels=("stage",))
+QUEUE_WAIT_SECONDS = Histogram("sahara_llm_queue_wait_seconds", "Time a generation waited for an LLM instance.")
+TTFT_SECONDS = Histogram("sahara_llm_time_to_first_token_seconds",
+                         "From picking up a generation to its first text piece.")
+TOKENS_PER_SECOND = Histogram("sahara_llm_decode_tokens_per_second", "Decode speed per generation.",
+                              buckets=RATE_BUCKETS)
+TOKENS = Counter("sahara_llm_tokens_total", "Prompt tokens evaluated and tokens generated.", labels=("kind",))
+
+METRICS = [STAGE_SECONDS, QUEUE_WAIT_SECONDS, TTFT_SECONDS, TOKENS_PER_SECOND, TOKENS]
+
+
+def render():
+    """Prometheus text exposition of all metrics, plus model load times from the registry."""
+    lines = ["# HELP sahara_telemetry_enabled 1 when SAHARA_TELEMETRY=1.",
+             "# TYPE sahara_telemetry_enabled gauge",
+             f"sahara_telemetry_enabled {int(ENABLED)}",
+             "# HELP sahara_model_load_seconds Time each loaded model took to load.",
+             "# TYPE sahara_model_load_seconds gauge"]
+    for name, status in sorted(registry.status().items()):
+        if status.get("load_seconds") is not None:
+            lines.append(f'sahara_model_load_seconds{{model="{name}"}} {status["load_seconds"]}')
+    for metric in METRICS:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+# ── Spans ────────────────────────────────────────────────────────────────────
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    """A stage timed into STAGE_SECONDS and, with the SDK, the current OTel span while open."""
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self._scope = None
+
+    def __enter__(self):
+        if _tracer is not None:
+            self._scope = _tracer.start_as_current_span(self.name, context=self.parent,
+                                                        attributes=self.attributes or None,
+                                                        record_exception=False, set_status_on_exception=False)
+            self._span = self._scope.__enter__()
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(perf_counter() - self._start, self.name)
+        if self._scope is not None:
+            if exc_type is not None:
+                _set_error(self._span, exc_type)
+            self._scope.__exit__(None, None, None)
+        return False
+
+
+def _set_error(span, exc_type):
+    from opentelemetry.trace import Status, StatusCode
+    span.set_status(Status(StatusCode.ERROR, exc_type.__name__))
+
+
+def span(name, parent=None, **attributes):
+    """
+    Context manager timing a block as stage `name`. `parent` is an OTel
+    context (current(), extract(), stage()); default is the current span.
+    Attributes must be numbers or flags, never user content.
+    """
+    if not ENABLED:
+        return _NOOP
+    return _Span(name, parent, attributes)
+
+
+def traced(name, headers=None):
+    """
+    Decorator form of span(). `headers` (a callable, e.g. lambda: request.headers)
+    supplies an incoming traceparent to continue. When telemetry is off the
+    function is returned as is.
+    """
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, parent=extract(headers()) if headers else None):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def stage(name, start, end=None, parent=None, **attributes):
+    """
+    Records a stage measured with perf_counter() (seconds; end defaults to now)
+    as a histogram sample and a finished span. Returns the span's context, to
+    pass as `parent` for its sub-stages, or None when telemetry is off.
+    """
+    if not ENABLED:
+        return None
+    end = perf_counter() if end is None else end
+    STAGE_SECONDS.observe(end - start, name)
+    if _tracer is None:
+        return None
+    from opentelemetry import trace
+    recorded = _tracer.start_span(name, context=parent, attributes=attributes or None,
+                                  start_time=_EPOCH_OFFSET_NS + int(start * 1e9))
+    recorded.end(end_time=_EPOCH_OFFSET_NS + int(end * 1e9))
+    return trace.set_span_in_context(recorded, parent)
+
+
+# ── Context propagation ──────────────────────────────────────────────────────
+def current():
+    """The current trace context, to hand to work that runs on another thread."""
+    if _tracer is None:
+        return None
+    from opentelemetry import context
+    return context.get_current()
+
+
+def bind(fn):
+    """fn wrapped to run in the caller's trace context (for thread pools). fn itself when off."""
+    if _tracer is None:
+        return fn
+    from opentelemetry import context
+    parent = context.get_current()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = context.attach(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            context.detach(token)
+    return wrapper
+
+
+def inject(headers):
+    """Adds the current traceparent to an outgoing request's headers dict and returns it."""
+    if _propagate is not None:
+        _propagate.inject(headers)
+    return headers
+
+
+def extract(headers):
+    """Trace context from incoming request headers (None when off or absent)."""
+    if _propagate is None or headers is None:
+        return None
+    return _propagate.extract(headers)
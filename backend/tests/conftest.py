@@ -0,0 +1,34 @@
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Tests import the backend modules the way the servers do (flat, from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class HashEmbedder:
+    """SentenceTransformer stand-in: unit vectors from hashed words, so similar texts land close."""
+    dim = 64
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(), "little")
+                vectors[row, h % self.dim] += 1.0 if h & 1 else -1.0
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-6)
+
+
+@pytest.fixture
+def rag_store(tmp_path, monkeypatch):
+    """rag with its stores in a temporary directory, the numpy backend and HashEmbedder."""
+    import rag
+    monkeypatch.setattr(rag, "CHROMA_PATH", str(tmp_path / "chroma_db"))
+    monkeypatch.setattr(rag, "VECTOR_BACKEND", "numpy")
+    monkeypatch.setattr(rag, "_opened", {})
+    embedder = HashEmbedder()
+    monkeypatch.setattr(rag, "get_embedder", lambda: embedder)
+    return rag
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from chunking import best_line, conversation_windows, memory_lines
+
+START = datetime(2023, 8, 15, 21, 5)
+
+
+def messages(*spec):
+    """(minutes after START, sender, text) triples as parsed messages."""
+    return [{'date': START + timedelta(minutes=m), 'sender': s, 'message': t} for m, s, t in spec]
+
+
+def windows(msgs, **kwargs):
+    return [(doc, meta) for _, doc, meta in conversation_windows(msgs, **kwargs)]
+
+
+def test_silence_starts_a_new_window():
+    out = windows(messages((0, "Aai", "jevan kela ka"), (2, "Arya", "ho"), (90, "Aai", "zopla ka")),
+                  max_gap_minutes=30)
+    assert [doc for doc, _ in out] == ["Aai: jevan kela ka\nArya: ho", "Aai: zopla ka"]
+    assert out[0][1]['count'] == 2 and out[0][1]['senders'] == "Aai, Arya"
+
+
+def test_full_window_is_cut_at_the_last_change_of_sender():
+    msgs = messages((0, "Aai", "a1"), (1, "Arya", "r1"), (2, "Arya", "r2"), (3, "Arya", "r3"))
+    out = windows(msgs, max_messages=3)
+    # Arya's burst stays together instead of being split 3 + 1
+    assert [doc for doc, _ in out] == ["Aai: a1", "Arya: r1\nArya: r2\nArya: r3"]
+
+
+def test_placeholders_are_skipped_and_short_lines_kept():
+    out = windows(messages((0, "Aai", "<Media omitted>"), (1, "Aai", "Ho"),
+                           (2, "Arya", "This message was deleted")))
+    assert [doc for doc, _ in out] == ["Aai: Ho"]
+
+
+def test_offsets_split_a_window_back_into_lines():
+    msgs = messages((0, "Aai", "jevan kela ka"), (1, "Arya", "ho, modak pan"), (2, "Aai", "chhan"))
+    (doc_id, document, metadata), = conversation_windows(msgs)
+    memory = {'document': document, 'metadata': metadata}
+    assert memory_lines(memory) == ["Aai: jevan kela ka", "Arya: ho, modak pan", "Aai: chhan"]
+    assert best_line(memory, "modak") == "Arya: ho, modak pan"
+
+
+def test_ids_depend_only_on_content():
+    msgs = messages((0, "Aai", "jevan kela ka"), (1, "Arya", "ho"))
+    first = [doc_id for doc_id, _, _ in conversation_windows(msgs)]
+    assert first == [doc_id for doc_id, _, _ in conversation_windows(list(msgs))]
+    edited = messages((0, "Aai", "jevan kela ka?"), (1, "Arya", "ho"))
+    assert first != [doc_id for doc_id, _, _ in conversation_windows(edited)]
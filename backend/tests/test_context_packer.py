@@ -0,0 +1,45 @@
+from context_packer import pack_memories, truncate_to_tokens
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def window(doc_id, lines, score=None, date="2024-01-01T10:00:00"):
+    document = "\n".join(lines)
+    offsets, pos = [], 0
+    for line in lines:
+        offsets.append(pos)
+        pos += len(line) + 1
+    memory = {"id": doc_id, "document": document,
+              "metadata": {"date": date, "sender": lines[0].split(":")[0], "offsets": ",".join(map(str, offsets))}}
+    if score is not None:
+        memory["score"] = score
+    return memory
+
+
+def test_empty_retrieval_packs_nothing():
+    lines, stats = pack_memories("Missing Aai today", [], count_words, budget=100)
+    assert lines == []
+    assert stats["candidates"] == 0 and stats["packed"] == 0 and stats["tokens"] == 0
+
+
+def test_duplicates_are_dropped():
+    same = ["Aai: Diwali la khup miss karte tujha", "Arya: Mi pan miss karto"]
+    memories = [window("a", same, 0.9), window("b", same, 0.8), window("c", ["Baba: Modak tayar ahet"], 0.5)]
+    lines, stats = pack_memories("Diwali miss", memories, count_words, budget=100)
+    assert stats["duplicates"] == 1
+    assert len(lines) == 2 and lines[0].startswith("[1] 2024-01-01 - Aai: Diwali")
+
+
+def test_budget_is_never_exceeded():
+    memories = [window(str(i), [f"Aai: {'khup aathvan yet aahe ' * 10}{i}"], 1.0 - i / 10) for i in range(5)]
+    lines, stats = pack_memories("aathvan", memories, count_words, budget=60, min_chars=20)
+    assert sum(count_words(line) for line in lines) == stats["tokens"] <= 60
+    assert stats["packed"] + stats["skipped"] + stats["duplicates"] <= stats["candidates"]
+
+
+def test_truncate_to_tokens_fits_budget():
+    text = "ek don teen char paach saha saat aath"
+    assert truncate_to_tokens(text, count_words, 3) == "ek don teen"
+    assert truncate_to_tokens(text, count_words, 100) == text
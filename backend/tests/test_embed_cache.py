@@ -0,0 +1,33 @@
+import numpy as np
+
+import embed_cache
+from embed_cache import EmbeddingCache
+
+
+def encoder(texts):
+    return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_disk_hits_do_not_write_until_a_batch_is_due(tmp_path, monkeypatch):
+    monkeypatch.setattr(embed_cache, "TOUCH_BATCH", 3)
+    path = str(tmp_path / "embeddings.sqlite3")
+    EmbeddingCache("m", path).encode(["a", "bb", "ccc"], encoder)
+
+    cache = EmbeddingCache("m", path)           # fresh process: empty LRU
+    before = cache._db.total_changes
+    vectors = cache.encode(["a", "bb"], lambda texts: 1 / 0)
+    assert vectors[:, 0].tolist() == [1, 2]
+    assert cache.disk_hits == 2 and cache._db.total_changes == before
+
+    cache.encode(["ccc"], lambda texts: 1 / 0)
+    assert cache._db.total_changes == before + 3
+
+
+def test_pending_access_times_are_written_with_the_next_store(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    EmbeddingCache("m", path).encode(["old"], encoder)
+    cache = EmbeddingCache("m", path)
+    cache.encode(["old"], encoder)
+    cache.encode(["new"], encoder)
+    assert not cache._touched
+    assert EmbeddingCache("m", path).stats()["entries"] == 2
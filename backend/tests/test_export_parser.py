@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import pytest
+
+from rag import iter_whatsapp_messages
+
+
+def parse(tmp_path, text):
+    path = tmp_path / "chat.txt"
+    path.write_text(text, encoding="utf-8")
+    return [(m.date, m.sender, m.message) for m in iter_whatsapp_messages(str(path))]
+
+
+EXPECTED = [
+    (datetime(2023, 8, 15, 21, 5, 12), "Aai", "jevan kela ka"),
+    (datetime(2023, 8, 15, 21, 7, 0), "Arya", "ho Aai, modak pan khalle"),
+]
+
+
+@pytest.mark.parametrize("export", [
+    # iOS: bracketed, seconds, 12-hour clock, left-to-right mark on some lines
+    "[15/08/2023, 9:05:12 PM] Messages and calls are end-to-end encrypted.\n"
+    "[15/08/2023, 9:05:12 PM] Aai: jevan kela ka\n"
+    "\u200e[15/08/2023, 9:07:00 PM] Arya: ho Aai, modak pan khalle\n",
+    # Android, 24-hour clock, two-digit year
+    "15/08/23, 21:05:12 - Messages and calls are end-to-end encrypted.\n"
+    "15/08/23, 21:05:12 - Aai: jevan kela ka\n"
+    "15/08/23, 21:07 - Arya: ho Aai, modak pan khalle\n",
+    # US: month first (told apart by 15 > 12), 12-hour clock
+    "8/15/23, 9:05:12 PM - Aai: jevan kela ka\n"
+    "8/15/23, 9:07 PM - Baba added Arya\n"
+    "8/15/23, 9:07 PM - Arya: ho Aai, modak pan khalle\n",
+    # Dotted date and time
+    "15.08.23, 21.05.12 - Aai: jevan kela ka\n"
+    "15.08.23, 21.07 - Arya: ho Aai, modak pan khalle\n",
+])
+def test_formats_parse_to_the_same_messages(tmp_path, export):
+    assert parse(tmp_path, export) == EXPECTED
+
+
+def test_multi_line_messages_are_joined(tmp_path):
+    export = ("15/08/23, 21:05 - Aai: jevan kela ka\n"
+              "lavkar ghari ye\n"
+              "\n"
+              "15/08/23, 21:07 - Arya: ho\n")
+    assert [m for _, _, m in parse(tmp_path, export)] == ["jevan kela ka lavkar ghari ye", "ho"]
+
+
+def test_file_without_messages_yields_nothing(tmp_path):
+    assert parse(tmp_path, "not a chat export\n") == []
@@ -0,0 +1,33 @@
+import llm_server
+
+
+class FakeLlama:
+    """Enough of llama_cpp.Llama for stream_pieces."""
+
+    def __init__(self, texts):
+        self.texts = texts
+
+    def __call__(self, prompt, stream=True, **params):
+        return (({"choices": [{"text": text}]}) for text in self.texts)
+
+
+def run(monkeypatch, texts, take=None):
+    monkeypatch.setattr(llm_server, "pack_prompt", lambda instance, query, memories, stats: "prompt")
+    stats = {}
+    pieces = llm_server.stream_pieces((FakeLlama(texts), None), "query", [], stats)
+    out = [piece for _, piece in zip(range(take), pieces)] if take is not None else list(pieces)
+    pieces.close()
+    return out, stats
+
+
+def test_whole_answer_is_marked_complete(monkeypatch):
+    out, stats = run(monkeypatch, ["I am", " here", " for you"])
+    assert "".join(out) == "I am here for you"
+    assert stats["complete"] is True
+
+
+def test_answer_stopped_early_is_not_complete(monkeypatch):
+    # What the scheduler does when a deadline passes: stop pulling and close
+    out, stats = run(monkeypatch, ["I am", " here", " for you"], take=1)
+    assert out == ["I am"]
+    assert "complete" not in stats
@@ -0,0 +1,28 @@
+import pytest
+
+import llm_server
+
+
+@pytest.fixture
+def client():
+    return llm_server.app.test_client()
+
+
+@pytest.mark.parametrize("body", [
+    {"priority": "abc"},
+    {"priority": 0},                 # reserved for crisis inputs
+    {"priority": llm_server.LOWEST_PRIORITY + 1},
+    {"priority": 1.5},
+    {"deadline_ms": "soon"},
+    {"deadline_ms": -1},
+])
+def test_bad_scheduling_fields_are_rejected(client, body):
+    response = client.post("/generate", json=dict(body, query="Missing Aai today"))
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_crisis_inputs_go_first_and_deadlines_are_capped():
+    assert llm_server._scheduling({"priority": 5}, "I want to end my life")[0] == llm_server.CRISIS_PRIORITY
+    priority, deadline_s = llm_server._scheduling({"deadline_ms": 1e9}, "Missing Aai today")
+    assert (priority, deadline_s) == (llm_server.DEFAULT_PRIORITY, llm_server.DEADLINE_S)
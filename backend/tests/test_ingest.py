@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+START = datetime(2023, 8, 15, 21, 5)
+TEXTS = ["jevan kela ka", "lavkar ghari ye", "modak tayar ahet",
+         "Diwali la ghari yenar ka", "phone kar jara", "tujhi khup kaalji vatte"]
+
+
+def chat(texts):
+    # Hours apart, so every message is its own conversation window
+    return [{'date': START + timedelta(hours=i), 'sender': "Aai" if i % 2 else "Arya", 'message': text}
+            for i, text in enumerate(texts)]
+
+
+def embedded_batches(rag, monkeypatch):
+    calls = []
+    embed = rag._embed_batch
+
+    def counting(ids, documents, metadatas):
+        calls.append(len(ids))
+        return embed(ids, documents, metadatas)
+    monkeypatch.setattr(rag, "_embed_batch", counting)
+    return calls
+
+
+def test_reimporting_the_same_export_adds_nothing(rag_store, monkeypatch):
+    assert rag_store.create_vector_store(chat(TEXTS), "chat").count() == len(TEXTS)
+
+    calls = embedded_batches(rag_store, monkeypatch)
+    index = rag_store.create_vector_store(chat(TEXTS), "chat")
+    assert calls == []
+    assert index.count() == len(TEXTS)
+
+
+def test_only_new_messages_are_embedded(rag_store, monkeypatch):
+    rag_store.create_vector_store(chat(TEXTS[:4]), "chat")
+
+    calls = embedded_batches(rag_store, monkeypatch)
+    index = rag_store.create_vector_store(chat(TEXTS), "chat")
+    assert sum(calls) == 2
+    assert index.count() == len(TEXTS)
+
+
+def test_prune_removes_messages_deleted_from_the_export(rag_store):
+    rag_store.create_vector_store(chat(TEXTS), "chat")
+    kept = [m for m in chat(TEXTS) if m['message'] != "modak tayar ahet"]
+
+    index = rag_store.create_vector_store(kept, "chat")
+    assert index.count() == len(TEXTS) - 1
+    assert all("modak" not in memory['document'] for memory in index.get(list(index.iter_ids())))
+    assert len(rag_store.get_lexical_index().ids("chat")) == len(TEXTS) - 1
+
+
+def test_without_prune_deleted_messages_stay(rag_store):
+    rag_store.create_vector_store(chat(TEXTS), "chat")
+    index = rag_store.create_vector_store(chat(TEXTS[:3]), "chat", prune=False)
+    assert index.count() == len(TEXTS)
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from chunking import conversation_windows, message_text
+from lexical import LexicalIndex
+from rag import _lexical_confident
+
+TOP_K = 3
+
+
+def index_with(tmp_path, documents):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    index.add("c", [f"d{i}" for i in range(len(documents))], documents)
+    return index
+
+
+def filler(n):
+    return [f"weather report number {i} for the office" for i in range(n)]
+
+
+def test_distinct_matches_skip_dense(tmp_path):
+    documents = ["modak tayar ahet, Ganpati chi tayari"] * TOP_K + filler(40)
+    terms, hits = index_with(tmp_path, documents).search("c", "modak Ganpati", TOP_K * 3)
+    assert _lexical_confident(terms, hits, TOP_K)
+
+
+def test_more_matching_documents_do_not_skip_dense(tmp_path):
+    # The same query over a bigger corpus where many windows contain both terms:
+    # nothing separates the top_k from the rest, so the dense stage has to run
+    documents = ["modak tayar ahet, Ganpati chi tayari"] * (TOP_K * 4) + filler(400)
+    terms, hits = index_with(tmp_path, documents).search("c", "modak Ganpati", TOP_K * 3)
+    assert not _lexical_confident(terms, hits, TOP_K)
+
+
+def test_single_term_never_skips_dense(tmp_path):
+    documents = ["modak tayar ahet"] * TOP_K + filler(40)
+    terms, hits = index_with(tmp_path, documents).search("c", "modak", TOP_K * 3)
+    assert not _lexical_confident(terms, hits, TOP_K)
+
+
+def test_sender_names_are_not_indexed(tmp_path):
+    start = datetime(2023, 8, 15, 21, 5)
+    messages = [{'date': start + timedelta(minutes=i), 'sender': sender, 'message': text}
+                for i, (sender, text) in enumerate([("Aai", "jevan kela ka"), ("Arya", "ho, modak pan")])]
+    (doc_id, document, metadata), = conversation_windows(messages)
+    assert message_text(document, metadata) == "jevan kela ka\nho, modak pan"
+
+    index = index_with(tmp_path, [message_text(document, metadata)] + filler(4))
+    assert index.search("c", "Arya Aai", 5)[1] == []
+    assert index.search("c", "modak jevan", 5)[1][0][0] == "d0"
+
+
+def test_prune_removes_lexical_rows_without_vectors(rag_store):
+    start = datetime(2023, 8, 15, 21, 5)
+    messages = [{'date': start + timedelta(hours=i), 'sender': "Aai", 'message': text}
+                for i, text in enumerate(["jevan kela ka", "modak tayar ahet"])]
+    # Left behind by an interrupted import of another export: postings, no vector
+    rag_store.get_lexical_index().add("chat", ["orphan"], ["modak Ganpati"])
+
+    rag_store.create_vector_store(messages, "chat")
+    lexical_ids = rag_store.get_lexical_index().ids("chat")
+    assert "orphan" not in lexical_ids and len(lexical_ids) == 2
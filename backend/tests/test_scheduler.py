@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import DeadlineExceeded, InferenceScheduler, JobCancelled, QueueFull
+
+
+def reply(text):
+    """A job function: jobs are generators, like llm_server.stream_pieces."""
+    def job(instance):
+        yield text
+    return job
+
+
+def blocked_scheduler(max_queue):
+    """A one-instance scheduler whose worker is stuck on a job until the event is set."""
+    release = threading.Event()
+
+    def hold(instance):
+        release.wait(5)
+        yield "done"
+
+    scheduler = InferenceScheduler(lambda slot: None, instances=1, max_queue=max_queue)
+    running = scheduler.submit(hold)
+    while scheduler.stats()["running"] == 0:
+        threading.Event().wait(0.001)
+    return scheduler, running, release
+
+
+def test_timed_out_waiters_free_their_queue_slots():
+    scheduler, running, release = blocked_scheduler(max_queue=2)
+    try:
+        for _ in range(2):
+            job = scheduler.submit(reply("late"), deadline_s=0.01)
+            with pytest.raises(DeadlineExceeded):
+                list(job.results())
+
+        job = scheduler.submit(reply("ok"))
+        assert scheduler.stats()["queued"] == 1
+        assert scheduler.stats()["expired"] + scheduler.stats()["cancelled"] == 2
+    finally:
+        release.set()
+    assert list(job.results()) == ["ok"]
+    assert list(running.results()) == ["done"]
+    scheduler.close(5)
+
+
+def test_live_jobs_still_fill_the_queue():
+    scheduler, running, release = blocked_scheduler(max_queue=2)
+    try:
+        queued = [scheduler.submit(reply("ok")) for _ in range(2)]
+        with pytest.raises(QueueFull):
+            scheduler.submit(reply("ok"))
+        assert scheduler.stats()["rejected"] == 1
+    finally:
+        release.set()
+    assert [list(job.results()) for job in queued] == [["ok"], ["ok"]]
+    scheduler.close(5)
+
+
+def test_deadline_passing_mid_generation_is_an_error_for_a_slow_consumer():
+    def ticks(instance):
+        for i in range(20):
+            time.sleep(0.05)
+            yield f"t{i}"
+
+    scheduler = InferenceScheduler(lambda slot: None, instances=1, max_queue=2)
+    job = scheduler.submit(ticks, deadline_s=0.2)
+    received = []
+    with pytest.raises(DeadlineExceeded):
+        for piece in job.results():
+            received.append(piece)
+            time.sleep(0.1)
+    assert 0 < len(received) < 20
+    assert scheduler.stats()["expired"] == 1
+    scheduler.close(5)
+
+
+def test_cancelled_running_job_does_not_end_normally():
+    started = threading.Event()
+
+    def ticks(instance):
+        for i in range(20):
+            started.set()
+            time.sleep(0.02)
+            yield f"t{i}"
+
+    scheduler = InferenceScheduler(lambda slot: None, instances=1, max_queue=2)
+    job = scheduler.submit(ticks)
+    started.wait(5)
+    job.cancel()
+    with pytest.raises(JobCancelled):
+        list(job.results())
+    scheduler.close(5)
+
+
+def test_dropped_queued_jobs_report_why():
+    scheduler, running, release = blocked_scheduler(max_queue=2)
+    try:
+        cancelled = scheduler.submit(reply("never"))
+        cancelled.cancel()
+        expired = scheduler.submit(reply("never"), deadline_s=0.01)
+        time.sleep(0.05)
+        stats = scheduler.stats()
+    finally:
+        release.set()
+    assert (stats["cancelled"], stats["expired"]) == (1, 1)
+    with pytest.raises(JobCancelled):
+        list(cancelled.results())
+    with pytest.raises(DeadlineExceeded):
+        list(expired.results())
+    scheduler.close(5)
@@ -0,0 +1,28 @@
+from llm_server import SPEAKER_PREFIX, StreamCleaner
+
+STOPS = ["</s>", "\n\n"]
+
+
+def stream(tokens):
+    cleaner = StreamCleaner(STOPS)
+    pieces = [cleaner.feed(token) for token in tokens]
+    return pieces + [cleaner.finish()]
+
+
+def test_stop_split_across_tokens_drops_whitespace_before_it():
+    pieces = stream(["hi", " ", "</", "s>", " ignored"])
+    assert "".join(pieces) == "hi"
+    assert all(not piece.endswith(" ") for piece in pieces)
+
+
+def test_partial_marker_that_does_not_complete_is_released():
+    assert "".join(stream(["a", " <", "b>"])) == "a <b>"
+
+
+def test_speaker_prefix_split_across_tokens_is_removed():
+    head, tail = SPEAKER_PREFIX[:3], SPEAKER_PREFIX[3:]
+    assert "".join(stream([" ", head, tail, "I am here", " for you"])) == "I am here for you"
+
+
+def test_paragraph_break_stops():
+    assert "".join(stream(["one", "\n", "\n", "two"])) == "one"
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from vector_index import NumpyIndex, NumpyStore
+
+
+def unit_vectors(n, dim=32, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def fill(index, vectors, prefix="m"):
+    ids = [f"{prefix}{i}" for i in range(len(vectors))]
+    index.upsert(ids=ids, embeddings=vectors, documents=ids, metadatas=[{"row": i} for i in range(len(ids))])
+    index.commit()
+    return ids
+
+
+@pytest.mark.parametrize("written, reopened", [("float16", "int8"), ("int8", "float16")])
+def test_reopening_with_another_dtype_keeps_the_stored_one(tmp_path, written, reopened):
+    vectors = unit_vectors(6)
+    fill(NumpyStore(str(tmp_path), dtype=written).get_index("chat", create=True), vectors[:3])
+
+    index = NumpyStore(str(tmp_path), dtype=reopened).get_index("chat")
+    fill(index, vectors[3:], prefix="n")
+    reloaded = NumpyIndex(index.root, dtype=reopened)
+    assert str(reloaded._vectors.dtype) == written and len(reloaded._vectors) == 6
+    assert reloaded._scales is None if written == "float16" else len(reloaded._scales) == 6
+    assert reloaded.query(vectors[4], 1)[0]["id"] == "n1"
+
+
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_recall_against_brute_force(tmp_path, monkeypatch, dtype):
+    monkeypatch.setattr("vector_index.QUERY_BLOCK_ROWS", 256)    # several blocks per query
+    vectors = unit_vectors(2000, dim=64)
+    index = NumpyIndex(str(tmp_path), dtype=dtype)
+    ids = fill(index, vectors)
+
+    queries = unit_vectors(20, dim=64, seed=1)
+    recalls = []
+    for q in queries:
+        exact = {ids[row] for row in np.argsort(-(vectors @ q))[:10]}
+        found = index.query(q, 10)
+        assert [m["distance"] for m in found] == sorted(m["distance"] for m in found)
+        recalls.append(len(exact & {m["id"] for m in found}) / 10)
+    assert np.mean(recalls) >= 0.95
+
+
+def test_pending_and_deleted_rows(tmp_path):
+    vectors = unit_vectors(50)
+    index = NumpyIndex(str(tmp_path))
+    ids = fill(index, vectors[:40])
+
+    index.delete([ids[0]])
+    index.upsert(ids=["new"], embeddings=vectors[40:41], documents=["new"], metadatas=[{}])
+    assert index.query(vectors[0], 1)[0]["id"] != ids[0]
+    assert index.query(vectors[40], 1)[0]["id"] == "new"
+
+    index.commit()
+    assert index.count() == 40
+    assert index.query(vectors[40], 1)[0]["id"] == "new"
+    assert index.get([ids[0], "new"])[0]["id"] == "new"
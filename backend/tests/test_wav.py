@@ -0,0 +1,82 @@
+import io
+import json
+import struct
+
+import numpy as np
+import pytest
+
+import voice
+from voice import WAVE_FORMAT_EXTENSIBLE, WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, read_pcm
+
+RATE = 16000
+SIGNAL = np.array([0.0, 0.5, -0.5, 0.25, -1.0])
+
+
+def wav(samples_bytes, tag, width, channels=1, extensible=False):
+    """A RIFF/WAVE file around raw sample bytes (the wave module only writes integer PCM)."""
+    block = width * channels
+    fmt = struct.pack("<HHIIHH", WAVE_FORMAT_EXTENSIBLE if extensible else tag, channels, RATE,
+                      RATE * block, block, width * 8)
+    if extensible:
+        fmt += struct.pack("<HHI", 22, width * 8, 0) + struct.pack("<H", tag) + bytes(14)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt \
+        + b"data" + struct.pack("<I", len(samples_bytes)) + samples_bytes
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def decoded(audio):
+    pcm, rate = read_pcm(audio)
+    assert rate == RATE
+    return np.frombuffer(pcm, dtype=np.int16)
+
+
+def expected():
+    return np.clip(SIGNAL * 32767, -32768, 32767).astype(np.int16)
+
+
+def test_24_bit():
+    ints = (SIGNAL * (2 ** 23 - 1)).astype(np.int32)
+    raw = b"".join(int(v).to_bytes(3, "little", signed=True) for v in ints)
+    assert np.abs(decoded(wav(raw, WAVE_FORMAT_PCM, 3)).astype(int) - expected()).max() <= 1
+
+
+@pytest.mark.parametrize("extensible", [False, True])
+def test_float32_is_not_read_as_int32(extensible):
+    raw = SIGNAL.astype(np.float32).tobytes()
+    assert np.abs(decoded(wav(raw, WAVE_FORMAT_IEEE_FLOAT, 4, extensible=extensible)).astype(int)
+                  - expected()).max() <= 1
+
+
+def test_stereo_16_bit_is_mixed_down():
+    raw = np.repeat(expected(), 2).tobytes()
+    assert decoded(wav(raw, WAVE_FORMAT_PCM, 2, channels=2)).tolist() == expected().tolist()
+
+
+def test_unsupported_encoding_is_a_400():
+    mulaw = wav(bytes(100), 7, 1)
+    with pytest.raises(ValueError):
+        read_pcm(mulaw)
+    client = voice.app.test_client()
+    response = client.post("/voice", data={"audio": (io.BytesIO(mulaw), "voice.wav")})
+    assert response.status_code == 400
+    assert "unsupported WAV encoding" in response.get_json()["error"]
+
+
+class FakeSocket:
+    def __init__(self, path, frames):
+        self.request = type("Request", (), {"path": path})()
+        self.frames = list(frames)
+        self.sent = []
+
+    def recv(self):
+        return self.frames.pop(0)
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+@pytest.mark.parametrize("rate", ["abc", "-16000", "0", "1000000"])
+def test_stt_socket_rejects_a_bad_sample_rate(rate):
+    ws = FakeSocket(f"/stt?sample_rate={rate}", [bytes(3200), "end"])
+    voice.stt_socket(ws)
+    assert ws.sent == [{"type": "error", "error": "sample_rate must be an integer from 8000 to 48000"}]
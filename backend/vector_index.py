@@ -0,0 +1,353 @@
+"""
+Sahara in-process vector index
+==============================
+A per-user memory corpus is small (thousands to tens of thousands of 384-d
+vectors), so an exact scan over a memory-mapped matrix is fast enough and
+avoids Chroma's sqlite/HNSW/telemetry startup cost. Select it with
+SAHARA_VECTOR_BACKEND=numpy (int8) or numpy-f16 (float16), see rag.py.
+int8 is the default: a quarter of float32's size and faster to scan, since
+NumPy's float16 → float32 upcast is slower than int8's.
+
+On-disk layout, one directory per collection:
+
+  <path>/<name>.npindex/CURRENT        → name of the live version directory
+  <path>/<name>.npindex/v000007/
+      vectors.npy      (n, dim) float16, or int8 with per-row scales.npy
+      ids.npy          fixed-width bytes
+      doc_offsets.npy  + doc_blob.npy    UTF-8 documents, columnar
+      meta_offsets.npy + meta_blob.npy   JSON metadata, columnar
+
+The dtype chosen in rag.py applies to new indexes; an existing index keeps
+the dtype recorded in its vectors.npy, so switching between numpy and
+numpy-f16 never mixes the two in one file.
+
+Every file is opened with mmap_mode='r'; only the top-k rows are decoded.
+Writes are buffered and commit() writes a new version directory, then swaps
+CURRENT atomically, so readers never see a half-written index.
+
+NumpyIndex / NumpyStore expose the same interface as store.ChromaIndex /
+StoreManager, so create_vector_store and retrieve_memories work with either.
+"""
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Rows scored per matmul block, to bound the float32 temporaries
+QUERY_BLOCK_ROWS = 16384
+# Uncommitted rows held in memory before an automatic commit during ingestion
+FLUSH_ROWS = 16384
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _quantize(vectors, dtype):
+    """Returns (stored_vectors, scales_or_None) for unit-norm float32 input."""
+    if dtype == 'int8':
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    return vectors.astype(np.float16), None
+
+
+def _unpack_string(offsets, blob, row):
+    return bytes(blob[offsets[row]:offsets[row + 1]]).decode('utf-8')
+
+
+def _pack_strings(strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+class NumpyIndex:
+    max_batch_size = 4096
+
+    def __init__(self, root, dtype='int8'):
+        """dtype is for a new index; an existing one is opened with its stored dtype."""
+        if dtype not in ('float16', 'int8'):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.root = root
+        self.dtype = dtype
+        self._lock = threading.RLock()
+        self._pending = OrderedDict()   # id -> (unit vector, document, metadata)
+        self._deleted = set()
+        self._load()
+
+    # ── Loading ──────────────────────────────────────────────────────────────
+    def _current_version(self):
+        try:
+            with open(os.path.join(self.root, 'CURRENT'), encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        try:
+            self.loaded_mtime = os.stat(os.path.join(self.root, 'CURRENT')).st_mtime_ns
+        except FileNotFoundError:
+            self.loaded_mtime = 0
+        self.version = self._current_version()
+        self._rows = None
+        if self.version is None:
+            self._vectors = self._scales = None
+            self._ids = np.empty(0, dtype='S1')
+            return
+        vdir = os.path.join(self.root, self.version)
+        load = lambda name: np.load(os.path.join(vdir, name), mmap_mode='r')
+        self._vectors = load('vectors.npy')
+        self._scales = load('scales.npy') if os.path.exists(os.path.join(vdir, 'scales.npy')) else None
+        stored = str(self._vectors.dtype)
+        if stored != self.dtype:
+            # An index keeps the dtype it was written with: mixing rows would corrupt it
+            print(f"Vector index {self.root} stores {stored} vectors; using {stored}, not {self.dtype}")
+            self.dtype = stored
+        self._ids = load('ids.npy')
+        self._doc_offsets, self._doc_blob = load('doc_offsets.npy'), load('doc_blob.npy')
+        self._meta_offsets, self._meta_blob = load('meta_offsets.npy'), load('meta_blob.npy')
+
+    def _row_of(self):
+        # id -> row, built on first write-path use (queries don't need it)
+        if self._rows is None:
+            self._rows = {doc_id.decode(): row for row, doc_id in enumerate(self._ids)}
+        return self._rows
+
+    # ── Index interface ──────────────────────────────────────────────────────
+    def existing(self, ids):
+        with self._lock:
+            rows = self._row_of()
+            return {doc_id for doc_id in ids
+                    if doc_id in self._pending or (doc_id in rows and doc_id not in self._deleted)}
+
+    def get(self, ids):
+        """Documents for ids, in the given order; unknown ids are skipped."""
+        out = []
+        with self._lock:
+            rows = self._row_of()
+            for doc_id in ids:
+                if doc_id in self._pending:
+                    _, document, metadata = self._pending[doc_id]
+                elif doc_id in rows and doc_id not in self._deleted:
+                    row = rows[doc_id]
+                    document = _unpack_string(self._doc_offsets, self._doc_blob, row)
+                    metadata = json.loads(_unpack_string(self._meta_offsets, self._meta_blob, row))
+                else:
+                    continue
+                out.append({'id': doc_id, 'document': document, 'metadata': metadata})
+        return out
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        vectors = _normalize(embeddings)
+        with self._lock:
+            rows = self._row_of()
+            for doc_id, vec, doc, meta in zip(ids, vectors, documents, metadatas):
+                if doc_id in rows:
+                    self._deleted.add(doc_id)
+                self._pending[doc_id] = (vec, doc, meta)
+            if len(self._pending) >= FLUSH_ROWS:
+                self.commit()
+
+    def iter_ids(self, page_size=None):
+        with self._lock:
+            deleted = set(self._deleted)
+            pending = list(self._pending)
+            ids = self._ids
+        for doc_id in ids:
+            doc_id = doc_id.decode()
+            if doc_id not in deleted:
+                yield doc_id
+        yield from pending
+
+    def delete(self, ids):
+        with self._lock:
+            rows = self._row_of()
+            for doc_id in ids:
+                self._pending.pop(doc_id, None)
+                if doc_id in rows:
+                    self._deleted.add(doc_id)
+
+    def count(self):
+        with self._lock:
+            return len(self._ids) - len(self._deleted) + len(self._pending)
+
+    def query(self, embedding, top_k):
+        """Exact top-k by cosine. distance = squared L2 between unit vectors, as in Chroma."""
+        q = _normalize(embedding)[0]
+        with self._lock:
+            # Snapshot; the mmapped arrays are immutable, so scoring runs unlocked
+            vectors, scales, ids = self._vectors, self._scales, self._ids
+            deleted_rows = np.array([self._rows[d] for d in self._deleted], dtype=np.int64) \
+                if self._deleted else None
+            pending = dict(self._pending)
+            if vectors is not None:
+                docs = (self._doc_offsets, self._doc_blob)
+                metas = (self._meta_offsets, self._meta_blob)
+
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        n = 0 if vectors is None else len(vectors)
+        for start in range(0, n, QUERY_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + QUERY_BLOCK_ROWS], dtype=np.float32)
+            scores = block @ q
+            if scales is not None:
+                scores *= scales[start:start + len(block)]
+            if deleted_rows is not None:
+                local = deleted_rows[(deleted_rows >= start) & (deleted_rows < start + len(block))]
+                scores[local - start] = -np.inf
+            best_scores = np.concatenate([best_scores, scores])
+            best_rows = np.concatenate([best_rows, np.arange(start, start + len(block))])
+            if len(best_scores) > top_k:
+                keep = np.argpartition(-best_scores, top_k)[:top_k]
+                best_scores, best_rows = best_scores[keep], best_rows[keep]
+
+        results = [(float(s), int(r)) for s, r in zip(best_scores, best_rows) if s != -np.inf]
+        results += [(float(vec @ q), doc_id) for doc_id, (vec, _, _) in pending.items()]
+        results.sort(key=lambda item: -item[0])
+
+        out = []
+        for score, ref in results[:top_k]:
+            if isinstance(ref, str):
+                doc_id = ref
+                _, document, metadata = pending[ref]
+            else:
+                doc_id = ids[ref].decode()
+                document = _unpack_string(*docs, ref)
+                metadata = json.loads(_unpack_string(*metas, ref))
+            out.append({'id': doc_id, 'document': document, 'metadata': metadata,
+                        'distance': max(0.0, 2.0 - 2.0 * score)})
+        return out
+
+    # ── Persistence ──────────────────────────────────────────────────────────
+    def commit(self):
+        """Writes buffered changes as a new version and swaps it in atomically."""
+        with self._lock:
+            if not self._pending and not self._deleted:
+                return
+            n = len(self._ids)
+            keep = np.ones(n, dtype=bool)
+            if self._deleted:
+                keep[[self._rows[d] for d in self._deleted]] = False
+            kept = np.flatnonzero(keep)
+
+            new_ids = list(self._pending)
+            new_vecs = np.stack([v for v, _, _ in self._pending.values()]) if new_ids else None
+            new_docs = [d for _, d, _ in self._pending.values()]
+            new_meta = [json.dumps(m, ensure_ascii=False) for _, _, m in self._pending.values()]
+
+            # Vectors: kept rows are copied as stored (no re-quantization)
+            parts, scale_parts = [], []
+            if n:
+                parts.append(np.asarray(self._vectors[kept]))
+                if self._scales is not None:
+                    scale_parts.append(np.asarray(self._scales[kept]))
+            if new_vecs is not None:
+                quantized, scales = _quantize(new_vecs, self.dtype)
+                parts.append(quantized)
+                if scales is not None:
+                    scale_parts.append(scales)
+            if parts:
+                vectors = np.concatenate(parts)
+            else:
+                vectors = np.empty((0, 0), dtype=np.int8 if self.dtype == 'int8' else np.float16)
+
+            ids = [self._ids[r].decode() for r in kept] + new_ids
+            docs = [_unpack_string(self._doc_offsets, self._doc_blob, r) for r in kept] + new_docs
+            metas = [_unpack_string(self._meta_offsets, self._meta_blob, r) for r in kept] + new_meta
+
+            old_version = self.version
+            number = int(old_version[1:]) + 1 if old_version else 1
+            version = f"v{number:06d}"
+            vdir = os.path.join(self.root, version)
+            os.makedirs(vdir, exist_ok=True)
+            np.save(os.path.join(vdir, 'vectors.npy'), vectors)
+            if self.dtype == 'int8':
+                np.save(os.path.join(vdir, 'scales.npy'),
+                        np.concatenate(scale_parts) if scale_parts else np.empty(0, np.float32))
+            np.save(os.path.join(vdir, 'ids.npy'), np.array([i.encode() for i in ids], dtype='S'))
+            doc_offsets, doc_blob = _pack_strings(docs)
+            meta_offsets, meta_blob = _pack_strings(metas)
+            np.save(os.path.join(vdir, 'doc_offsets.npy'), doc_offsets)
+            np.save(os.path.join(vdir, 'doc_blob.npy'), doc_blob)
+            np.save(os.path.join(vdir, 'meta_offsets.npy'), meta_offsets)
+            np.save(os.path.join(vdir, 'meta_blob.npy'), meta_blob)
+
+            tmp = os.path.join(self.root, 'CURRENT.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(version)
+            os.replace(tmp, os.path.join(self.root, 'CURRENT'))
+
+            self._pending.clear()
+            self._deleted.clear()
+            self._load()
+            if old_version:
+                # Readers still mapping the old files keep them alive on POSIX;
+                # on Windows the delete fails and the directory is left behind.
+                shutil.rmtree(os.path.join(self.root, old_version), ignore_errors=True)
+
+
+class NumpyStore:
+    """StoreManager counterpart for NumpyIndex: an LRU of open indexes with staleness checks."""
+
+    def __init__(self, path, max_open=4, dtype='int8'):
+        self.path = path
+        self.max_open = max_open
+        self.dtype = dtype
+        self._indexes = OrderedDict()   # name -> NumpyIndex
+        self._lock = threading.Lock()
+
+    def _root(self, name):
+        return os.path.join(self.path, f"{name}.npindex")
+
+    def _version(self, name):
+        try:
+            return os.stat(os.path.join(self._root(name), 'CURRENT')).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def get_index(self, name, create=False):
+        version = self._version(name)
+        with self._lock:
+            cached = self._indexes.get(name)
+            # An index with uncommitted writes is never swapped out from under its writer
+            if cached is not None and (cached.loaded_mtime == version or cached._pending):
+                self._indexes.move_to_end(name)
+                return cached
+
+            root = self._root(name)
+            if not create and not os.path.isdir(root):
+                raise FileNotFoundError(f"Vector index '{name}' does not exist")
+            os.makedirs(root, exist_ok=True)
+            index = NumpyIndex(root, dtype=self.dtype)
+            self._indexes[name] = index
+            self._indexes.move_to_end(name)
+            while len(self._indexes) > self.max_open:
+                self._indexes.popitem(last=False)
+            return index
+
+    def mark_changed(self, name):
+        with self._lock:
+            self._indexes.pop(name, None)
+
+    def forget(self, name):
+        self.mark_changed(name)
+
+    def delete_collection(self, name):
+        with self._lock:
+            self._indexes.pop(name, None)
+            shutil.rmtree(self._root(name), ignore_errors=True)
+
+    def open_collections(self):
+        with self._lock:
+            return list(self._indexes)
@@ -2,34 +2,211 @@
 Sahara Phase 3 — Voice & Safety
 =================================
 1. Offline STT via Vosk (Hindi/Marathi/English)
-2. Distress detection via pitch + energy analysis (librosa)
+2. Distress detection via pitch + energy analysis (distress.py, NumPy only)
 3. Crisis protocol — auto-triggers if distress is high
+4. Streaming STT over WebSocket (ws://127.0.0.1:5008/stt, SAHARA_STT_PORT): partial
+   transcripts while the user is still speaking, crisis check on every one
 
 Install:
-  pip install vosk librosa sounddevice numpy flask
+  pip install vosk sounddevice numpy flask websockets
   
 Download Vosk model (Hindi, works for Marathi too):
   wget https://alphacephei.com/vosk/models/vosk-model-small-hi-0.22.zip
   unzip vosk-model-small-hi-0.22.zip -d ./vosk_model
 """
 import requests
-import io, json, wave, numpy as np, librosa, sounddevice as sd
-from vosk import Model, KaldiRecognizer
-from flask import Flask, request, jsonify
+import os, json, struct, threading, numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from time import perf_counter
+from urllib.parse import urlparse, parse_qs
+from flask import Blueprint, Flask, Response, request, jsonify
+from models import registry
+import distress
+import telemetry
+from safety import CRISIS_WORDS, CRISIS_RESPONSE, is_crisis   # 3. Crisis keywords (EN + HI + MR)
 
-# ── Load Vosk STT model (offline, on-device) ──────────────────────────────────
-print("🔄 Loading Vosk STT model...")
-STT_MODEL   = Model("./vosk_model/vosk-model-small-hi-0.22")
+# ── Vosk STT model (offline, on-device) ───────────────────────────────────────
+# Registered lazily: loads on first /voice or via the startup warmup, so the
+# server can answer /health immediately.
+VOSK_MODEL_PATH = "./vosk_model/vosk-model-small-hi-0.22"
 SAMPLE_RATE = 16000
-print("✅ Vosk ready!")
+
+def _load_vosk():
+    from vosk import Model
+    return Model(VOSK_MODEL_PATH)
+
+registry.register("vosk", _load_vosk)
+
+REQUIRED_MODELS = ["vosk"]
 
 # ── 1. Speech-to-Text ─────────────────────────────────────────────────────────
+STT_CHUNK_BYTES = 8000          # 0.25 s of 16 kHz 16-bit mono per AcceptWaveform call
+RECOGNIZER_POOL_SIZE = 4        # idle recognizers kept per sample rate
+
+class RecognizerPool:
+    """
+    Building a KaldiRecognizer allocates a decoder over the whole Vosk graph;
+    reuse them (Reset() between utterances) instead of one per request.
+    """
+    def __init__(self, size=RECOGNIZER_POOL_SIZE):
+        self.size = size
+        self._idle = {}             # sample rate -> [KaldiRecognizer]
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @contextmanager
+    def recognizer(self, sample_rate=SAMPLE_RATE):
+        with self._lock:
+            idle = self._idle.setdefault(sample_rate, [])
+            rec = idle.pop() if idle else None
+            if rec is not None:
+                self.reused += 1
+        if rec is None:
+            from vosk import KaldiRecognizer
+            rec = KaldiRecognizer(registry.get("vosk"), sample_rate)
+            with self._lock:
+                self.created += 1
+        try:
+            yield rec
+        finally:
+            rec.Reset()
+            with self._lock:
+                idle = self._idle.setdefault(sample_rate, [])
+                if len(idle) < self.size:
+                    idle.append(rec)
+
+    def stats(self):
+        with self._lock:
+            return {"created": self.created, "reused": self.reused,
+                    "idle": sum(len(idle) for idle in self._idle.values())}
+
+recognizers = RecognizerPool()
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE   # the real format tag is the first field of its sub-format GUID
+
+def parse_wav_header(data: bytes):
+    """
+    (sample_rate, channels, sample_width, pcm_offset, format_tag) of a RIFF/WAVE
+    header, or None if data does not start with one. Tolerates the bogus sizes
+    that streaming recorders write before the length is known.
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    pos, fmt = 12, None
+    while pos + 8 <= len(data):
+        chunk_id, size = data[pos:pos + 4], struct.unpack("<I", data[pos + 4:pos + 8])[0]
+        if chunk_id == b"fmt ":
+            tag, channels, rate = struct.unpack("<HHI", data[pos + 8:pos + 16])
+            width = struct.unpack("<H", data[pos + 22:pos + 24])[0] // 8
+            if tag == WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                tag = struct.unpack("<H", data[pos + 32:pos + 34])[0]
+            fmt = (rate, channels, width, tag)
+        elif chunk_id == b"data":
+            return fmt[:3] + (pos + 8, fmt[3]) if fmt else None
+        pos += 8 + size + (size & 1)
+    return None
+
+def read_pcm(audio_bytes: bytes):
+    """
+    (16-bit mono PCM bytes, sample_rate) from a WAV file; other input is taken as raw
+    16 kHz PCM. Decodes 8/16/24/32-bit integer and 32/64-bit float WAVs; raises
+    ValueError for any other encoding (compressed, a-law, ...).
+    """
+    header = parse_wav_header(audio_bytes)
+    if header is None:
+        return audio_bytes, SAMPLE_RATE
+    rate, channels, width, offset, tag = header
+    if tag == WAVE_FORMAT_PCM and width in (1, 2, 3, 4):
+        dtype = {1: np.uint8, 2: np.int16, 3: np.uint8, 4: np.int32}[width]
+    elif tag == WAVE_FORMAT_IEEE_FLOAT and width in (4, 8):
+        dtype = {4: np.float32, 8: np.float64}[width]
+    else:
+        raise ValueError(f"unsupported WAV encoding (format {tag:#x}, {width * 8}-bit): "
+                         "send 16-bit PCM")
+    if not channels:
+        raise ValueError("WAV header has no channels")
+    pcm = audio_bytes[offset:]
+    if channels == 1 and width == 2 and tag == WAVE_FORMAT_PCM:
+        return pcm, rate
+    samples = np.frombuffer(pcm[:len(pcm) - len(pcm) % (width * channels)], dtype=dtype)
+    if width == 3:
+        # Little-endian 24-bit: the top two bytes of each sample are its 16-bit value
+        samples = np.ascontiguousarray(samples.reshape(-1, 3)[:, 1:]).view(np.int16).ravel()
+    samples = samples.reshape(-1, channels).mean(axis=1)
+    if tag == WAVE_FORMAT_IEEE_FLOAT:
+        samples = np.clip(samples, -1, 1) * 32767
+    elif width == 1:
+        samples = (samples - 128) * 256
+    elif width == 4:
+        samples = samples / 65536
+    return samples.astype(np.int16).tobytes(), rate
+
+class StreamingTranscript:
+    """
+    Feeds PCM to one recognizer and turns Vosk output into events:
+      {"type": "partial", "text"}   current utterance so far (sent when it changes)
+      {"type": "final",   "text"}   utterance finished (Vosk detected the pause)
+      {"type": "crisis",  ...}      first time the transcript so far trips safety.is_crisis
+    """
+    def __init__(self, rec):
+        self.rec = rec
+        self.finals = []
+        self.partial = ""
+        self.crisis = False
+
+    @property
+    def text(self):
+        return " ".join(t for t in self.finals + [self.partial] if t)
+
+    def _crisis_event(self):
+        if not self.crisis and is_crisis(self.text):
+            self.crisis = True
+            return [{"type": "crisis", **CRISIS_RESPONSE, "transcript": self.text}]
+        return []
+
+    def feed(self, pcm: bytes):
+        events = []
+        for i in range(0, len(pcm), STT_CHUNK_BYTES):
+            if self.rec.AcceptWaveform(pcm[i:i + STT_CHUNK_BYTES]):
+                text = json.loads(self.rec.Result()).get("text", "").strip()
+                self.partial = ""
+                if text:
+                    self.finals.append(text)
+                    events.append({"type": "final", "text": text})
+            else:
+                partial = json.loads(self.rec.PartialResult()).get("partial", "").strip()
+                if partial != self.partial:
+                    self.partial = partial
+                    events.append({"type": "partial", "text": partial})
+            events += self._crisis_event()
+        return events
+
+    def finish(self):
+        text = json.loads(self.rec.FinalResult()).get("text", "").strip()
+        self.partial = ""
+        events = []
+        if text:
+            self.finals.append(text)
+            events.append({"type": "final", "text": text})
+        return events + self._crisis_event()
+
 def transcribe(audio_bytes: bytes) -> str:
-    """Convert raw WAV audio bytes → text using Vosk (fully offline)."""
-    rec = KaldiRecognizer(STT_MODEL, SAMPLE_RATE)
-    rec.AcceptWaveform(audio_bytes)
-    result = json.loads(rec.FinalResult())
-    return result.get("text", "").strip()
+    """Convert WAV (or raw 16 kHz PCM) audio bytes → text using Vosk (fully offline)."""
+    return transcribe_pcm(*read_pcm(audio_bytes))
+
+def transcribe_pcm(pcm: bytes, rate: int) -> str:
+    """transcribe() for audio already decoded by read_pcm."""
+    start = perf_counter()
+    with recognizers.recognizer(rate) as rec:
+        stream = StreamingTranscript(rec)
+        stream.feed(pcm)
+        stream.finish()
+    telemetry.stage("voice.stt", start, audio_s=round(len(pcm) / 2 / rate, 2))
+    return stream.text
 
 
 # ── 2. Distress Detector ──────────────────────────────────────────────────────
@@ -41,73 +218,63 @@ def analyze_distress(audio_bytes: bytes) -> dict:
       - Speech rate      → fast = panic / distress  
       - Energy (RMS)     → loud/erratic = emotional dysregulation
     Returns: { score: 0-1, level: calm/mild/high, flags: [...] }
+
+    Features come from distress.py: one decode, one framing, vectorized YIN
+    pitch (librosa.pyin was slower than real time on CPU).
     """
-    # Load audio from bytes
-    audio, sr = librosa.load(io.BytesIO(audio_bytes), sr=SAMPLE_RATE, mono=True)
-
-    flags = []
-    score = 0.0
-
-    # Pitch variance (F0)
-    f0, _, _ = librosa.pyin(audio, fmin=80, fmax=400, sr=sr)
-    f0_clean  = f0[~np.isnan(f0)]
-    if len(f0_clean) > 10:
-        pitch_var = float(np.std(f0_clean))
-        if pitch_var > 60:
-            flags.append("high_pitch_variance")
-            score += 0.35
-
-    # Energy / RMS
-    rms      = librosa.feature.rms(y=audio)[0]
-    rms_var  = float(np.std(rms))
-    rms_mean = float(np.mean(rms))
-    if rms_var > 0.02:
-        flags.append("erratic_energy")
-        score += 0.30
-    if rms_mean > 0.08:
-        flags.append("loud_speech")
-        score += 0.15
-
-    # Speech rate via zero-crossing rate (proxy)
-    zcr      = librosa.feature.zero_crossing_rate(audio)[0]
-    zcr_mean = float(np.mean(zcr))
-    if zcr_mean > 0.15:
-        flags.append("fast_speech_rate")
-        score += 0.20
-
-    score = round(min(score, 1.0), 2)
-    level = "high" if score >= 0.6 else "mild" if score >= 0.3 else "calm"
-
-    return {"score": score, "level": level, "flags": flags}
-
-
-# ── 3. Crisis keywords (EN + HI + MR) ────────────────────────────────────────
-CRISIS_WORDS = [
-    "suicide", "kill myself", "end my life", "want to die",
-    "jeena nahi", "marna chahta", "jiv dyaycha", "sampvaycha", "nako aata"
-]
-
-CRISIS_RESPONSE = {
-    "response": "💙 Tum akele nahi ho. Please abhi inhe call karo:\n\n"
-                "• iCall: 9152987821\n"
-                "• Vandrevala: 1860-2662-345 (24/7)\n"
-                "• SNEHI: 044-24640050\n\n"
-                "Sahara tumhare saath hai. 🙏",
-    "crisis": True
-}
-
-def is_crisis(text: str) -> bool:
-    return any(kw in text.lower() for kw in CRISIS_WORDS)
+    return analyze_distress_pcm(*read_pcm(audio_bytes))
+
+def analyze_distress_pcm(pcm: bytes, rate: int, cancelled=None):
+    """analyze_distress() for decoded audio; None if `cancelled` was set first."""
+    start = perf_counter()
+    result = distress.analyze(distress.pcm_to_float(pcm, rate, SAMPLE_RATE), SAMPLE_RATE, cancelled)
+    telemetry.stage("voice.distress", start, cancelled=result is None)
+    return result
 
 
 # ── 4. Flask endpoint ─────────────────────────────────────────────────────────
-app = Flask(__name__)
+# /voice lives on a blueprint so gateway.py can mount it next to /chat and /generate
+bp = Blueprint("voice", __name__)
+
+# Where transcripts go next. gateway.py registers chat_server in-process
+# (use_local_chat); standalone, /chat is reached over a pooled keep-alive session.
+CHAT_URL = os.environ.get("SAHARA_CHAT_URL", "http://127.0.0.1:5006/chat")
+_local_chat = None
+_chat_http = requests.Session()
+_chat_http.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=8))
+
+def use_local_chat(reply_fn):
+    """Send transcripts to reply_fn(message) -> str instead of POSTing to CHAT_URL."""
+    global _local_chat
+    _local_chat = reply_fn
+
+def ask_chat(message: str) -> str:
+    with telemetry.span("voice.chat"):
+        if _local_chat is not None:
+            return _local_chat(message)
+        # traceparent continues this request's trace in chat_server
+        response = _chat_http.post(CHAT_URL, json={"message": message}, headers=telemetry.inject({}),
+                                   timeout=10)
+        response.raise_for_status()
+        return response.json().get("response", "")
+
+# Distress analysis runs here, concurrently with STT in the request thread
+# (Vosk and NumPy's FFT release the GIL)
+voice_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="distress")
 
-@app.route("/voice", methods=["POST"])
+def _ms(since):
+    return round((perf_counter() - since) * 1000, 1)
+
+def _timed(fn, *args):
+    start = perf_counter()
+    return fn(*args), _ms(start)
+
+@bp.route("/voice", methods=["POST"])
+@telemetry.traced("voice.request", headers=lambda: request.headers)
 def voice():
     """
     Accepts: multipart WAV audio file
-    Returns: { transcript, distress, crisis, forward_to_llm }
+    Returns: { transcript, distress, crisis, forward_to_llm, timings }
     
     React Native sends audio as:
       const form = new FormData();
@@ -118,18 +285,42 @@ def voice():
         return jsonify({"error": "audio file required"}), 400
 
     audio_bytes = request.files["audio"].read()
+    timings = {}
+    start = perf_counter()
+
+    # Step 0 — Decode once; STT and distress analysis share the PCM buffer
+    try:
+        pcm, rate = read_pcm(audio_bytes)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    timings["decode_ms"] = _ms(start)
+    telemetry.stage("voice.decode", start)
 
-    # Step 1 — Transcribe
-    transcript = transcribe(audio_bytes)
+    # Step 1 — Distress analysis in the pool while this thread transcribes
+    cancel_distress = threading.Event()
+    distress_job = voice_pool.submit(telemetry.bind(_timed), analyze_distress_pcm, pcm, rate, cancel_distress)
+
+    stage = perf_counter()
+    transcript = transcribe_pcm(pcm, rate)
+    timings["stt_ms"] = _ms(stage)
     if not transcript:
-        return jsonify({"error": "Could not understand audio"}), 422
+        cancel_distress.set()
+        timings["total_ms"] = _ms(start)
+        return jsonify({"error": "Could not understand audio", "timings": timings}), 422
 
-    # Step 2 — Crisis keyword check (always first)
+    # Step 2 — Crisis keyword check (always first): the distress result is not needed
     if is_crisis(transcript):
-        return jsonify({**CRISIS_RESPONSE, "transcript": transcript, "distress": None})
+        cancel_distress.set()
+        distress_job.cancel()
+        timings["distress_cancelled"] = True
+        timings["total_ms"] = _ms(start)
+        return jsonify({**CRISIS_RESPONSE, "transcript": transcript, "distress": None,
+                        "timings": timings})
 
-    # Step 3 — Distress analysis
-    distress = analyze_distress(audio_bytes)
+    # Step 3 — Distress result (usually finished while STT ran)
+    stage = perf_counter()
+    distress, timings["distress_ms"] = distress_job.result()
+    timings["distress_wait_ms"] = _ms(stage)
 
     # Step 4 — If high distress, override with calming response before LLM
     if distress["level"] == "high":
@@ -142,33 +333,32 @@ def voice():
                                "Saath mein... andar... aur bahar. 💙\n\n"
                                "Ab batao, kya chal raha hai?",
             "forward_to_llm":  False,   # pause, calm first
+            "timings":         dict(timings, total_ms=_ms(start)),
         })
 
     # Step 5 — Safe to forward transcript to Phase 2 LLM
-    # Step 5 — Safe → Call Phase 2 LLM internally
+    # Step 5 — Safe → Call Phase 2 chat (in-process under gateway.py, else HTTP)
 
     try:
-        llm_response = requests.post(
-            "http://127.0.0.1:5006/chat",
-            json={"message": transcript},
-            timeout=10
-        )
-
-        if llm_response.status_code == 200:
-            chat_data = llm_response.json()
-            return jsonify({
-                "transcript": transcript,
-                "distress": distress,
-                "crisis": False,
-                "response": chat_data.get("response", ""),
-                "forward_to_llm": False
-            })
-
-        else:
-            return jsonify({
-                "error": "LLM service unavailable",
-                "transcript": transcript
-            }), 500
+        stage = perf_counter()
+        reply = ask_chat(transcript)
+        timings["chat_ms"] = _ms(stage)
+        timings["total_ms"] = _ms(start)
+
+        return jsonify({
+            "transcript": transcript,
+            "distress": distress,
+            "crisis": False,
+            "response": reply,
+            "forward_to_llm": False,
+            "timings": timings
+        })
+
+    except requests.HTTPError:
+        return jsonify({
+            "error": "LLM service unavailable",
+            "transcript": transcript
+        }), 500
 
     except Exception as e:
         return jsonify({
@@ -177,6 +367,105 @@ def voice():
         }), 500
 
 
+def health_body():
+    return {"status": "ok", "stt_loaded": registry.is_loaded("vosk"),
+            "recognizers": recognizers.stats(),
+            "chat": "in-process" if _local_chat is not None else CHAT_URL}
+
+
+# Standalone server (gateway.py serves the same routes in one process)
+app = Flask(__name__)
+app.register_blueprint(bp)
+
+@app.route("/health", methods=["GET"])
+def health():
+    return jsonify(health_body())
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    body, status = registry.readiness(REQUIRED_MODELS)
+    return jsonify(body), status
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(telemetry.render(), content_type=telemetry.CONTENT_TYPE)
+
+
+# ── 5. Streaming STT over WebSocket ───────────────────────────────────────────
+# Flask cannot hold a WebSocket, so this runs on its own port next to it.
+# SAHARA_STT_PORT moves it, e.g. to run voice.py next to gateway.py (both default to 5008).
+STT_WS_PORT = int(os.environ.get("SAHARA_STT_PORT", "5008"))
+STT_RATES = (8000, 48000)   # sample rates accepted on the socket, inclusive
+
+def _is_end(message: str) -> bool:
+    text = message.strip().lower()
+    if text.startswith("{"):
+        try:
+            text = str(json.loads(text).get("type", ""))
+        except (ValueError, AttributeError):
+            return False
+    return text in ("end", "eof")
+
+def stt_socket(ws):
+    """
+    ws://127.0.0.1:5008/stt?sample_rate=16000
+
+    Client → server: binary frames of 16-bit mono PCM while the user speaks
+    (a WAV header at the start is recognised and skipped), then the text
+    frame "end". Server → client: JSON text frames, the StreamingTranscript
+    events as they happen, then
+      {"type": "result", "transcript": ..., "crisis": bool}
+    The crisis event goes out as soon as the partial transcript trips it,
+    before the upload has finished.
+    """
+    query = parse_qs(urlparse(ws.request.path).query)
+    rate = query.get("sample_rate", [SAMPLE_RATE])[0]
+    rate = int(rate) if str(rate).isdigit() else 0
+
+    first = ws.recv()
+    header = parse_wav_header(first) if isinstance(first, bytes) else None
+    if header is not None:
+        rate, channels, width, offset, tag = header
+        if channels != 1 or width != 2 or tag != WAVE_FORMAT_PCM:
+            ws.send(json.dumps({"type": "error", "error": "stream 16-bit mono PCM"}))
+            return
+        first = first[offset:]
+    if not STT_RATES[0] <= rate <= STT_RATES[1]:
+        ws.send(json.dumps({"type": "error",
+                            "error": f"sample_rate must be an integer from {STT_RATES[0]} to {STT_RATES[1]}"}))
+        return
+
+    with recognizers.recognizer(rate) as rec:
+        stream = StreamingTranscript(rec)
+        message = first
+        while True:
+            if isinstance(message, bytes):
+                events = stream.feed(message)
+            elif _is_end(message):
+                break
+            else:
+                events = []
+            for event in events:
+                ws.send(json.dumps(event, ensure_ascii=False))
+            message = ws.recv()
+        for event in stream.finish():
+            ws.send(json.dumps(event, ensure_ascii=False))
+        ws.send(json.dumps({"type": "result", "transcript": stream.text, "crisis": stream.crisis},
+                           ensure_ascii=False))
+
+def start_stt_server(host="127.0.0.1", port=STT_WS_PORT):
+    """Serves stt_socket from a daemon thread (one thread per connection); returns the server."""
+    from websockets.sync.server import serve
+    server = serve(stt_socket, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True, name="stt-websocket").start()
+    return server
+
+
 if __name__ == "__main__":
     print("🌿 Sahara Phase 3 voice bridge → http://127.0.0.1:5007")
+    print(f"   Streaming STT → ws://127.0.0.1:{STT_WS_PORT}/stt")
+    registry.warmup(REQUIRED_MODELS)
+    start_stt_server()
     app.run(port=5007)
\ No newline at end of file